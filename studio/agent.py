@@ -1,40 +1,18 @@
-from langchain_openai import ChatOpenAI
 from langgraph.graph import MessagesState
-from langchain_core.messages import SystemMessage, HumanMessage, RemoveMessage
-from ast import literal_eval
-import sqlite3
-import requests
-from langchain_community.utilities.sql_database import SQLDatabase
-from sqlalchemy import create_engine
-from sqlalchemy.pool import StaticPool
+from langchain_core.messages import SystemMessage
 from langgraph.graph import StateGraph, START, END
 from langgraph.prebuilt import ToolNode
-from langchain_core.tools import tool
 from typing import Literal
 from langgraph.types import interrupt
-
-# Create db
-def get_engine_for_chinook_db():
-    """Pull sql file, populate in-memory database, and create engine."""
-    url = "https://raw.githubusercontent.com/lerocha/chinook-database/master/ChinookDatabase/DataSources/Chinook_Sqlite.sql"
-    response = requests.get(url)
-    sql_script = response.text
-
-    connection = sqlite3.connect(":memory:", check_same_thread=False)
-    connection.executescript(sql_script) # high-level wrapper around our connection, this will now be the central object which represents the db
-    
-    return create_engine(
-        "sqlite://", # tells sqlalchemy "im working with sqlite", it's empty as we're going to supply our own connection
-        creator=lambda: connection, # this tells sqlalchemy to use, and re-use our connection. this is important as the db lives in ram so the connection must stay the same
-        poolclass=StaticPool, # similarly we do not want a dynamic connection pool to be created
-        connect_args={"check_same_thread": False}, # same as before, allow use of connections across threads
-    )
-
-engine = get_engine_for_chinook_db()
-db = SQLDatabase(engine)
-
-# Define model
-model = ChatOpenAI(temperature=0, streaming=True, model="gpt-5-nano")
+from core import get_engine, get_model, bind_tools_lazily, run_db
+from catalog import get_catalog
+from checkpointer import get_checkpointer
+from customer_profile import load_profile
+from email_capture import email_tool_call, find_single_email
+from metrics import instrument_node, instrument_tool_node
+from prompts import prompt_cache_stats, sql_model_messages
+from summary import count_history_tokens, is_turn_start, run_summarizer, arun_summarizer, should_summarize_after_answer, should_summarize_before_turn
+from tools import confirm_purchase, get_customer_info, purchase_calls, quote_pending_purchase, sql_tools
 
 # Info retrieval agent message
 email_msg = SystemMessage(content="You are a conversational and friendly assistant. " \
@@ -59,94 +37,62 @@ class State(MessagesState, total=False):
 
     customer_id: int
     customer_name: str
+    customer_profile: dict
     summary: str
-
-# Define tools
-@tool
-def get_customer_info(email: str) -> dict:
-    """Look up customer info given their email. ALWAYS make sure you have the email before invoking this.
-
-    Args:
-        email: str"""
-
-    try:
-        customer_info_as_string = db.run(f"SELECT * FROM Customer WHERE Email = '{email}';", include_columns = True)
-        customer_info = literal_eval(customer_info_as_string[1:-1])
-        customer_id = customer_info["CustomerId"]
-        customer_name = customer_info["FirstName"]
-
-        return {"customer_id": customer_id, "customer_name": customer_name}
-    except Exception as e:
-        
-        return {"messages": e}
-
-@tool
-def make_sql_query(sql_query: str) -> dict:
-    """Query the SQL database to retrieve information relevant to you or the customer.
-    Before querying a table make sure to get_table_info.
-    Some tables will contain a key for customer id.
-    The customer id is defined in the state.
-    You may not make a sql query for information that contains any other customer id.
-    
-    Args:
-        sql_query: str"""
-    sql_query_output = db.run(f"{sql_query}", include_columns = True)
-    return {"sql_query_output": sql_query_output}
-
-@tool
-def get_table_info(table_name: str) -> dict:
-    """Run this call on a table within the database before running a sql query on that table.
-    The table name HAS to be in the list db_table_names to be a valid table.
-
-    Args:
-        table_name: str"""
-    
-    try:
-        table_info = db.get_table_info([table_name])
-    except Exception as e:
-        print(e)
-    
-    return {"table_name": table_name, "table_info": table_info}
-
-# Collect all tools
-sql_tools = [make_sql_query, get_table_info]
-sql_tools_by_name = {tool.name: tool for tool in sql_tools}
+    history_tokens: int
+    purchase_decision: dict
 
 # Bind tools to model
-sql_model = model.bind_tools(sql_tools)
-customer_email_model = model.bind_tools([get_customer_info])
+get_sql_model = bind_tools_lazily(sql_tools)
+get_customer_email_model = bind_tools_lazily([get_customer_info])
 
 # Create Nodes
+# Every node has a sync and an async version: graph.invoke runs the first, graph.ainvoke (and the
+# LangGraph server) the second, so an in-flight conversation never holds a thread while the LLM works
 def customer_email_node(state: State):
 
-    return {"messages": [customer_email_model.invoke([email_msg] + state["messages"])]}
+    # The user just typed one email address, skip the model and look it up straight away
+    email = find_single_email(state["messages"])
+    if email is not None:
+        return {"messages": [email_tool_call(email)]}
+
+    response = get_customer_email_model().invoke([email_msg] + state["messages"])
+    prompt_cache_stats.record(response)
+
+    return {"messages": [response]}
+
+async def acustomer_email_node(state: State):
+
+    email = find_single_email(state["messages"])
+    if email is not None:
+        return {"messages": [email_tool_call(email)]}
+
+    response = await get_customer_email_model().ainvoke([email_msg] + state["messages"])
+    prompt_cache_stats.record(response)
+
+    return {"messages": [response]}
 
 def sql_model_node(state: State):
 
-    # Get table names
-    db_table_names = db.get_usable_table_names()
+    # Get table names and schema digest, both cached in the catalog
+    catalog = get_catalog()
 
-    # Inject state into the system prompt
-    state_context = f"""
-The current customer's ID is {state["customer_id"]}.
-The current customer's name is {state['customer_name']}.
-The valid database tables are: {db_table_names}.
-Always use the customer's ID from state when making queries.
-Do not ask the user for their ID.
-"""
-    contextual_sys_msg = SystemMessage(content=sql_msg.content + "\n\n" + state_context)
+    response = get_sql_model().invoke(sql_model_messages(sql_msg, state, catalog))
+    prompt_cache_stats.record(response)
 
+    return {"messages": [response], "history_tokens": count_history_tokens(state, response)}
 
-    return {"messages": [sql_model.invoke([contextual_sys_msg] + state["messages"])]}
+async def asql_model_node(state: State):
 
-def get_info_node(state: State):
-    """Performs the get customer info tool call."""
+    catalog = await run_db(get_catalog)
 
-    # last message contains param tool_calls, a list of dicts
-    tool_call = state["messages"][-1].tool_calls[0]
+    response = await get_sql_model().ainvoke(sql_model_messages(sql_msg, state, catalog))
+    prompt_cache_stats.record(response)
 
-    # make tool call, draft tool message
-    observation = get_customer_info.invoke(tool_call["args"])
+    return {"messages": [response], "history_tokens": count_history_tokens(state, response)}
+
+def confirm_customer(tool_call: dict, observation: dict):
+    """Ask the user to confirm the account we found and build the state update."""
 
     # check that we were able to retrieve info
     if "customer_name" in observation:
@@ -176,40 +122,68 @@ def get_info_node(state: State):
 
         return {'messages': tool_message}
 
+def get_info_node(state: State):
+    """Performs the get customer info tool call."""
+
+    # last message contains param tool_calls, a list of dicts
+    tool_call = state["messages"][-1].tool_calls[0]
+
+    # make tool call, draft tool message
+    observation = get_customer_info.invoke(tool_call["args"])
+
+    update = confirm_customer(tool_call, observation)
+
+    # Signed in, load the account summary once so the model need not query for it
+    if "customer_id" in update:
+        update["customer_profile"] = load_profile(get_engine(), update["customer_id"])
+    return update
+
+async def aget_info_node(state: State):
+    """Performs the get customer info tool call."""
+
+    tool_call = state["messages"][-1].tool_calls[0]
+    observation = await get_customer_info.ainvoke(tool_call["args"])
+
+    update = confirm_customer(tool_call, observation)
+    if "customer_id" in update:
+        update["customer_profile"] = await run_db(load_profile, get_engine(), update["customer_id"])
+    return update
 
 def summarizer_node(state: State):
-    
-    # First get the summary if it exists
-    summary = state.get("summary", "")
-
-    # Create our summarization prompt 
-    if summary:
-        
-        # If a summary already exists, add it to the prompt
-        summary_message = (
-            f"This is summary of the conversation to date: {summary}\n\n"
-            "Extend the summary by taking into account the new messages above:"
-        )
-        
-    else:
-        # If no summary exists, just create a new one
-        summary_message = "Create a summary of the conversation above:"
 
-    # Add prompt to our history
-    messages = state["messages"] + [HumanMessage(content=summary_message)]
-    response = model.invoke(messages)
-    
-    # Delete all but the most recent message and add our summary to the state 
-    delete_messages = [RemoveMessage(id=m.id) for m in state["messages"][:-1]]
-    return {"summary": response.content, "messages": delete_messages}
+    # Keep the most recent message, the summary replaces everything before it
+    return run_summarizer(state, get_model(), keep_last=True)
+
+async def asummarizer_node(state: State):
+
+    return await arun_summarizer(state, get_model(), keep_last=True)
+
+def confirm_purchase_node(state: State):
+    """Ask the customer to confirm a create_invoice order before the tools run.
+
+    Resuming the interrupt runs this node again, not the tool node, so nothing is written twice."""
+
+    pending = quote_pending_purchase(get_engine(), state)
+    if pending is None:
+        return {}
+    return confirm_purchase(*pending)
+
+async def aconfirm_purchase_node(state: State):
+
+    pending = await run_db(quote_pending_purchase, get_engine(), state)
+    if pending is None:
+        return {}
+    return confirm_purchase(*pending)
 
 sql_tools_node = ToolNode(sql_tools)
 
 # Define router
-def check_customer_info(state: State) -> Literal["get_customer_email", "sql_model_node"]:
+def check_customer_info(state: State) -> Literal["get_customer_email", "summarizer_node", "sql_model_node"]:
 
     if "customer_id" not in state or "customer_name" not in state:
         return "get_customer_email"
+    elif should_summarize_before_turn(state):
+        return "summarizer_node"
     else:
         return "sql_model_node"
 
@@ -226,35 +200,49 @@ def customer_info_condition(state: State) -> Literal["get_info_node", "__end__"]
     else:
         return END
     
-def sql_agent_condition(state: State) -> Literal["sql_tools", "summarizer_node"]:
-    """Route to sql tool handler, or conversation summarizer if no tool is called."""
+def sql_agent_condition(state: State) -> Literal["confirm_purchase", "sql_tools", "summarizer_node", "__end__"]:
+    """Route to the purchase confirmation or sql tool handler, the conversation summarizer once the history is over budget, or end."""
     
     # Get the last message
     message = state["messages"][-1]
     
     # Check if it's a Done tool call
-    if message.tool_calls:
+    if purchase_calls(message):
+        return "confirm_purchase"
+    elif message.tool_calls:
         return "sql_tools"
-    else:
+    elif should_summarize_after_answer(state):
         return "summarizer_node"
+    else:
+        return END
+
+def after_summary(state: State) -> Literal["sql_model_node", "__end__"]:
+    """A summary made at the start of a turn goes on to answer the user, one made at the end finishes it."""
+
+    if is_turn_start(state):
+        return "sql_model_node"
+    else:
+        return END
 
 # Create graph
 builder = StateGraph(State)
 
 # Add nodes
-builder.add_node("sql_model_node", sql_model_node)
-builder.add_node("sql_tools", sql_tools_node)
-builder.add_node("get_customer_email", customer_email_node)
-builder.add_node("get_info_node", get_info_node) 
-builder.add_node("summarizer_node", summarizer_node)
+builder.add_node("sql_model_node", instrument_node("agent", "sql_model_node", sql_model_node, asql_model_node))
+builder.add_node("sql_tools", instrument_tool_node("agent", "sql_tools", sql_tools_node))
+builder.add_node("confirm_purchase", instrument_node("agent", "confirm_purchase", confirm_purchase_node, aconfirm_purchase_node))
+builder.add_node("get_customer_email", instrument_node("agent", "get_customer_email", customer_email_node, acustomer_email_node))
+builder.add_node("get_info_node", instrument_node("agent", "get_info_node", get_info_node, aget_info_node))
+builder.add_node("summarizer_node", instrument_node("agent", "summarizer_node", summarizer_node, asummarizer_node))
 
 # Add edges
 builder.add_conditional_edges(START, check_customer_info)
 builder.add_conditional_edges("get_customer_email", customer_info_condition)
 builder.add_edge("get_info_node", "get_customer_email")
 builder.add_conditional_edges("sql_model_node", sql_agent_condition)
+builder.add_edge("confirm_purchase", "sql_tools")
 builder.add_edge("sql_tools", "sql_model_node")
-builder.add_edge("summarizer_node", END)
+builder.add_conditional_edges("summarizer_node", after_summary)
 
-# Compile graph, memory is handled by LangGraph
-graph = builder.compile()
+# Compile graph. Memory is handled by LangGraph unless CHECKPOINT_PATH points at a local checkpoint file
+graph = builder.compile(checkpointer=get_checkpointer())
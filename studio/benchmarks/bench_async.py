@@ -0,0 +1,72 @@
+"""Conversations per second through the SQL agent, sync vs async.
+
+Every conversation is one signed-in turn of agent.py's graph: sql_model_node asks for a query,
+sql_tools runs it and sql_model_node answers, so two LLM calls with `--latency` seconds each.
+summarizer_node closes the turn without one, a single turn stays far below SUMMARY_TOKEN_BUDGET
+(see summary.py: past it the summary runs on a background thread, or inline for these runs as
+they have no thread_id). The sync build runs conversations on a pool of `--threads` threads
+with graph.invoke; the async build runs all of them on one event loop with graph.ainvoke.
+Run from the studio directory:
+
+    python benchmarks/bench_async.py --conversations 200 --latency 0.2 --threads 16
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+os.environ.setdefault("QUERY_CACHE_SIZE", "0") # measure the database too, not just the cache
+
+from langchain_core.messages import HumanMessage
+from fake_model import FakeChatModel
+import core
+import agent
+from catalog import get_catalog
+
+def conversation(i: int) -> dict:
+    return {"messages": [HumanMessage(content="How many invoices do I have?")], "customer_id": 1 + i % 59, "customer_name": "Bench"}
+
+def run_sync(conversations: int, threads: int) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda i: agent.graph.invoke(conversation(i)), range(conversations)))
+    return conversations / (time.perf_counter() - start)
+
+async def run_async(conversations: int, concurrency: int) -> float:
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with limit:
+            await agent.graph.ainvoke(conversation(i))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(conversations)))
+    return conversations / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.2, help="simulated seconds per LLM call")
+    parser.add_argument("--threads", type=int, default=16, help="worker threads for the sync build")
+    parser.add_argument("--concurrency", type=int, default=None, help="in-flight conversations for the async build, defaults to all")
+    args = parser.parse_args()
+
+    core.set_model(FakeChatModel(latency=args.latency))
+    get_catalog() # build the database and catalog before timing
+
+    results = {
+        "sync": run_sync(args.conversations, args.threads),
+        "async": asyncio.run(run_async(args.conversations, args.concurrency or args.conversations)),
+    }
+    for build, rate in results.items():
+        print(f"{build:>5}: {rate:8.1f} conversations/s")
+    print(json.dumps({"conversations": args.conversations, "latency": args.latency, "threads": args.threads, **results}))
+
+if __name__ == "__main__":
+    main()
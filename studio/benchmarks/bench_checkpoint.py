@@ -0,0 +1,164 @@
+"""Checkpoint write and read latency and on-disk size, for InMemorySaver and SqliteCheckpointer.
+
+Runs the agent graph with the scripted model over the scenarios in scenarios.py (sign-in and
+purchases confirmed at interrupts, long conversations that get summarized) on each saver:
+
+    memory          InMemorySaver, the reference for latency
+    sqlite-plain    every put commits on its own and stores whole values
+    sqlite-delta    every put commits on its own, list channels stored as deltas
+    sqlite          batched commits and deltas, the defaults
+
+It times every put, put_writes and get_tuple the graph makes, then the cold read of each
+conversation's latest state from a new saver on the same file, and reports the file size per
+100 turns. By default turns follow each other immediately, so the batched saver's get_tuple
+usually has to commit the previous turn first. --pause waits between turns like a user would,
+long enough for the flusher to have committed them. Run from the studio directory:
+
+    python benchmarks/bench_checkpoint.py --conversations 24 --threads 4
+    python benchmarks/bench_checkpoint.py --pause 0.02
+
+The last line of output is json.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from langgraph.checkpoint.memory import InMemorySaver
+from bench_graphs import NodeTimer, percentile, run_conversation
+from fake_model import ScriptedChatModel
+from scenarios import GRAPH_SCENARIOS, SCRIPTS
+import core
+import summary
+import agent
+from checkpointer import SqliteCheckpointer
+from query import run_query
+
+SAVERS = {
+    "memory": lambda path: InMemorySaver(),
+    "sqlite-plain": lambda path: SqliteCheckpointer(path, flush_interval=0, keyframe_every=1),
+    "sqlite-delta": lambda path: SqliteCheckpointer(path, flush_interval=0),
+    "sqlite": lambda path: SqliteCheckpointer(path),
+}
+
+class SaverTimer:
+    """Wall time of the saver calls the graph makes, wrapped on the instance."""
+
+    def __init__(self, saver, methods=("put", "put_writes", "get_tuple")):
+        self._lock = threading.Lock()
+        self.durations = defaultdict(list)
+        for name in methods:
+            setattr(saver, name, self._wrap(name, getattr(saver, name)))
+
+    def _wrap(self, name, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.durations[name].append(elapsed)
+        return timed
+
+def latency(durations: list) -> dict:
+    if not durations:
+        return {"calls": 0, "mean_ms": 0.0, "p95_ms": 0.0}
+    return {"calls": len(durations), "mean_ms": 1000 * statistics.mean(durations), "p95_ms": 1000 * percentile(durations, 0.95)}
+
+def file_bytes(path: str) -> int:
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+class PausedGraph:
+    """A compiled graph that waits after every invoke, the user reading and typing."""
+
+    def __init__(self, graph, pause: float):
+        self.graph = graph
+        self.pause = pause
+
+    def invoke(self, *args, **kwargs):
+        result = self.graph.invoke(*args, **kwargs)
+        time.sleep(self.pause)
+        return result
+
+def run(name: str, path: str, threads: int, conversations: int, customers: list, pause: float) -> dict:
+    saver = SAVERS[name](path)
+    timer = SaverTimer(saver)
+    graph = PausedGraph(agent.builder.compile(checkpointer=saver), pause)
+    scenarios = GRAPH_SCENARIOS["agent"]
+    node_timer = NodeTimer()
+
+    def one(i):
+        return run_conversation(graph, "agent", scenarios[i % len(scenarios)], customers[i % len(customers)], f"{name}-{i}", node_timer)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        turns = sum(pool.map(one, range(conversations)))
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "turns": turns,
+        "turns_per_second": turns / elapsed,
+        "put": latency(timer.durations["put"]),
+        "put_writes": latency(timer.durations["put_writes"]),
+        "get_tuple": latency(timer.durations["get_tuple"]),
+    }
+    if isinstance(saver, SqliteCheckpointer):
+        saver.close()
+        result.update(batches=saver.batches, full_blobs=saver.full_blobs, delta_blobs=saver.delta_blobs)
+        with saver._writer as connection:
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        result["bytes_per_100_turns"] = 100 * file_bytes(path) / turns
+
+        # a new saver has nothing cached, so this is what a restarted server pays per conversation
+        cold = SqliteCheckpointer(path)
+        reads = []
+        for i in range(conversations):
+            read_start = time.perf_counter()
+            cold.get_tuple({"configurable": {"thread_id": f"{name}-{i}"}})
+            reads.append(time.perf_counter() - read_start)
+        result["cold_read"] = latency(reads)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--savers", nargs="+", default=list(SAVERS), choices=list(SAVERS))
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--conversations", type=int, default=24)
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds between turns")
+    parser.add_argument("--budget", type=int, default=1500, help="SUMMARY_TOKEN_BUDGET, low enough for the long scenario to summarize")
+    args = parser.parse_args()
+
+    summary.SUMMARY_TOKEN_BUDGET = args.budget
+    core.set_model(ScriptedChatModel(latency=0, scripts=SCRIPTS))
+    customers = run_query(core.get_engine(), "SELECT CustomerId, FirstName, Email FROM Customer ORDER BY CustomerId").rows
+    directory = tempfile.mkdtemp(prefix="bench-checkpoint-")
+
+    results = {}
+    try:
+        for name in args.savers:
+            r = results[name] = run(name, os.path.join(directory, f"{name}.db"), args.threads, args.conversations, customers, args.pause)
+            size = f"{r['bytes_per_100_turns'] / 1024:8.1f} KiB/100 turns" if "bytes_per_100_turns" in r else f"{'':>8}"
+            print(f"{name:>13} {r['turns_per_second']:7.1f} turns/s  put {r['put']['mean_ms']:6.3f} ms (p95 {r['put']['p95_ms']:6.3f})  "
+                  f"writes {r['put_writes']['mean_ms']:6.3f} ms  get {r['get_tuple']['mean_ms']:6.3f} ms  {size}")
+            if "cold_read" in r:
+                print(f"{'':>14}cold read {r['cold_read']['mean_ms']:6.3f} ms (p95 {r['cold_read']['p95_ms']:6.3f})  "
+                      f"{r['batches']} commits  {r['full_blobs']} full / {r['delta_blobs']} delta blobs")
+    finally:
+        summary.background_summaries.shutdown(wait=True)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(json.dumps({"conversations": args.conversations, "threads": args.threads, "pause": args.pause, "budget": args.budget, "results": results}))
+
+if __name__ == "__main__":
+    main()
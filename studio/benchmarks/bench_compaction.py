@@ -0,0 +1,101 @@
+"""Prompt tokens per turn of sql_agent.py, with and without compaction of old tool results.
+
+Plays the sql_agent scenarios in scenarios.py, except buy, once per COMPACT_TOKEN_BUDGET in --budgets (-1 is
+compaction off) with the scripted model, and reports the prompt tokens the model was sent per turn
+and per call, approximately. It also checks that every budget makes the same tool calls and gives
+the same answers as compaction off. Summaries run in deferred mode so the counts are repeatable.
+Run from the studio directory:
+
+    python benchmarks/bench_compaction.py --budgets -1 1000 0
+
+The last line of output is json.
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.types import Command
+from bench_graphs import conversation_turns
+from fake_model import ScriptedChatModel
+from scenarios import GRAPH_SCENARIOS, SCRIPTS
+import compaction
+import core
+import summary
+import sql_agent
+import tools
+from pages import RESULT_PAGE_HANDLES, PageHandles
+from query import run_query
+
+# buy writes an invoice, which would make every later run's results longer
+SCENARIOS = [scenario for scenario in GRAPH_SCENARIOS["sql_agent"] if scenario != "buy"]
+
+def turn_transcript(messages: list) -> list:
+    """What the model did in the last turn, without the call ids that differ between runs."""
+    turn = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+    return [(m.content, [(c["name"], c["args"]) for c in m.tool_calls]) for m in messages[turn:] if isinstance(m, AIMessage)]
+
+def run(budget: int, customer: tuple) -> dict:
+    compaction.COMPACT_TOKEN_BUDGET = budget
+    compaction.compaction_stats = compaction.CompactionStats()
+    # handles are numbered globally, start every run at p1 so the transcripts compare
+    tools.page_handles = PageHandles(RESULT_PAGE_HANDLES)
+    model = ScriptedChatModel(latency=0, scripts=SCRIPTS)
+    core.set_model(model)
+    graph = sql_agent.builder.compile(checkpointer=InMemorySaver())
+    customer_id, first_name, _ = customer
+
+    per_turn, transcripts = [], []
+    for scenario in SCENARIOS:
+        config = {"configurable": {"thread_id": f"compaction-{budget}-{scenario}"}}
+        for i, text in enumerate(conversation_turns("sql_agent", scenario)):
+            update = {"messages": [HumanMessage(content=text)]}
+            if i == 0:
+                update.update(customer_id=customer_id, customer_name=first_name)
+            before = model.prompt_tokens
+            result = graph.invoke(update, config)
+            while "__interrupt__" in result:
+                result = graph.invoke(Command(resume="yes"), config)
+            per_turn.append(model.prompt_tokens - before)
+            transcripts.append(turn_transcript(result["messages"]))
+
+    return {
+        "turns": len(per_turn),
+        "llm_calls": model.calls,
+        "prompt_tokens": model.prompt_tokens,
+        "prompt_tokens_per_turn": model.prompt_tokens / len(per_turn),
+        "max_prompt_tokens_per_turn": max(per_turn),
+        "prompt_tokens_per_call": model.prompt_tokens / model.calls,
+        "compaction": compaction.compaction_stats.stats(),
+        "transcripts": transcripts,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budgets", nargs="+", type=int, default=[-1, compaction.COMPACT_TOKEN_BUDGET, 0])
+    parser.add_argument("--summary-budget", type=int, default=summary.SUMMARY_TOKEN_BUDGET, help="SUMMARY_TOKEN_BUDGET")
+    args = parser.parse_args()
+
+    summary.SUMMARY_TOKEN_BUDGET = args.summary_budget
+    summary.SUMMARY_MODE = "deferred"
+    customer = run_query(core.get_engine(), "SELECT CustomerId, FirstName, Email FROM Customer ORDER BY CustomerId LIMIT 1").rows[0]
+
+    results, first = {}, None
+    for budget in args.budgets:
+        r = results[budget] = run(budget, customer)
+        transcripts = r.pop("transcripts")
+        first = first or transcripts
+        r["same_as_first"] = transcripts == first
+        print(f"budget {budget:>5}: {r['prompt_tokens_per_turn']:8.1f} prompt tokens/turn (max {r['max_prompt_tokens_per_turn']}), "
+              f"{r['prompt_tokens_per_call']:7.1f}/call, {r['llm_calls']} calls, history {r['compaction']['tokens_before']} -> {r['compaction']['tokens_after']} tokens, "
+              f"{r['compaction']['outputs_compacted']} results compacted, {r['compaction']['schemas_dropped']} schemas dropped"
+              + ("" if r["same_as_first"] else "  DIFFERENT TRANSCRIPT"))
+    print(json.dumps({"summary_budget": args.summary_budget, "results": results}))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""End-to-end benchmark of all three graphs with a scripted model, no endpoint needed.
+
+Every conversation replays one of the scenarios in scenarios.py (sign-in with the confirmation
+interrupt, catalogue browsing, purchase history, a long conversation that gets summarized) through
+graph.invoke with an in-memory checkpointer. For each graph and each `--threads` value it runs
+`--conversations` conversations on that many threads and reports throughput, LLM calls, time spent
+in the database and per-node latency. Run from the studio directory:
+
+    python benchmarks/bench_graphs.py --threads 1 4 16 --conversations 48 --latency 0.05
+
+The last line of output is json. Save it and pass it back with --baseline to fail (exit code 1)
+when any graph's turns per second drops by more than --tolerance:
+
+    python benchmarks/bench_graphs.py | tail -n 1 > baseline.json
+    python benchmarks/bench_graphs.py --baseline baseline.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+os.environ.setdefault("QUERY_CACHE_SIZE", "0") # measure the database too, not just the cache
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.types import Command
+from sqlalchemy import event
+from fake_model import ScriptedChatModel
+from scenarios import GRAPH_SCENARIOS, SCENARIOS, SCRIPTS
+import core
+import summary
+import agent
+import info_agent
+import sql_agent
+from catalog import get_catalog
+from query import run_query
+
+GRAPHS = {"agent": agent, "sql_agent": sql_agent, "info_agent": info_agent}
+
+class NodeTimer(BaseCallbackHandler):
+    """Wall time of every node run, from LangGraph's callbacks. Only the run LangGraph starts for a
+    graph step counts, not the runnables nested inside it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = {}
+        self.durations = defaultdict(list)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, tags=None, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        if node and kwargs.get("name") == node and any(tag.startswith("graph:step:") for tag in tags or ()):
+            with self._lock:
+                self._started[run_id] = (node, time.perf_counter())
+
+    def _finish(self, run_id):
+        with self._lock:
+            started = self._started.pop(run_id, None)
+            if started is not None:
+                self.durations[started[0]].append(time.perf_counter() - started[1])
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id) # includes the interrupt in get_info_node
+
+class DbTimer:
+    """Time spent executing statements on the Chinook engines, every statement whoever runs it, from
+    SQLAlchemy's cursor events. That covers sqlite running a statement up to its first row, the
+    rows fetched after that are not counted."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seconds = 0.0
+        self.calls = 0
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("bench_started", []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["bench_started"].pop()
+        with self._lock:
+            self.seconds += elapsed
+            self.calls += 1
+
+    def install(self):
+        # the read and write engines are the same one unless CHINOOK_DB_MODE=pool
+        for engine in set(core._get_engines()):
+            event.listen(engine, "before_cursor_execute", self.before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", self.after_cursor_execute)
+
+def conversation_turns(graph_name: str, scenario: str) -> list:
+    turns = list(SCENARIOS[scenario])
+    if graph_name == "agent" and scenario != "sign_in":
+        turns = SCENARIOS["sign_in"] + turns
+    return turns
+
+def run_conversation(graph, graph_name: str, scenario: str, customer: tuple, thread_id: str, timer: NodeTimer) -> int:
+    """Play one scenario, confirming the account whenever the graph interrupts. Returns the number of turns."""
+    customer_id, first_name, email = customer
+    config = {"configurable": {"thread_id": thread_id}, "callbacks": [timer]}
+    turns = conversation_turns(graph_name, scenario)
+    for i, text in enumerate(turns):
+        update = {"messages": [HumanMessage(content=text.replace("{email}", email))]}
+        if i == 0 and graph_name == "sql_agent":
+            update.update(customer_id=customer_id, customer_name=first_name)
+        result = graph.invoke(update, config)
+        while "__interrupt__" in result:
+            result = graph.invoke(Command(resume="yes"), config)
+    return len(turns)
+
+def percentile(values: list, q: float) -> float:
+    return sorted(values)[int(q * (len(values) - 1))]
+
+def run(graph_name: str, threads: int, conversations: int, latency: float, customers: list, db_timer: DbTimer) -> dict:
+    model = ScriptedChatModel(latency=latency, scripts=SCRIPTS)
+    core.set_model(model)
+    graph = GRAPHS[graph_name].builder.compile(checkpointer=InMemorySaver())
+    timer = NodeTimer()
+    scenarios = GRAPH_SCENARIOS[graph_name]
+    db_seconds, db_calls = db_timer.seconds, db_timer.calls
+
+    def one(i):
+        scenario = scenarios[i % len(scenarios)]
+        return run_conversation(graph, graph_name, scenario, customers[i % len(customers)], f"{graph_name}-{threads}-{i}", timer)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        turns = sum(pool.map(one, range(conversations)))
+    elapsed = time.perf_counter() - start
+
+    db_seconds = db_timer.seconds - db_seconds
+    return {
+        "seconds": elapsed,
+        "conversations_per_second": conversations / elapsed,
+        "turns_per_second": turns / elapsed,
+        "turns": turns,
+        "llm_calls": model.calls,
+        "prompt_tokens": model.prompt_tokens,
+        "db_calls": db_timer.calls - db_calls,
+        "db_seconds": db_seconds,
+        "db_ms_per_turn": 1000 * db_seconds / turns,
+        "nodes": {
+            node: {
+                "calls": len(durations),
+                "mean_ms": 1000 * statistics.mean(durations),
+                "p95_ms": 1000 * percentile(durations, 0.95),
+            }
+            for node, durations in sorted(timer.durations.items())
+        },
+    }
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Lines describing every graph/threads pair whose turns per second fell below the baseline."""
+    regressions = []
+    for graph_name, by_threads in results.items():
+        for threads, result in by_threads.items():
+            before = baseline.get("results", {}).get(graph_name, {}).get(threads)
+            if before is None:
+                continue
+            change = result["turns_per_second"] / before["turns_per_second"] - 1
+            line = f"{graph_name} x{threads}: {before['turns_per_second']:.1f} -> {result['turns_per_second']:.1f} turns/s ({change:+.0%})"
+            print(line)
+            if change < -tolerance:
+                regressions.append(line)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--graphs", nargs="+", default=list(GRAPHS), choices=list(GRAPHS))
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--conversations", type=int, default=48, help="conversations per graph and thread count")
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated seconds per LLM call")
+    parser.add_argument("--budget", type=int, default=1500, help="SUMMARY_TOKEN_BUDGET, low enough for the long scenario to summarize")
+    parser.add_argument("--baseline", help="json line from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed drop in turns per second against the baseline")
+    args = parser.parse_args()
+
+    summary.SUMMARY_TOKEN_BUDGET = args.budget
+    get_catalog() # build the database and catalog before timing
+    customers = run_query(core.get_engine(), "SELECT CustomerId, FirstName, Email FROM Customer ORDER BY CustomerId").rows
+    db_timer = DbTimer()
+    db_timer.install()
+
+    results = {}
+    for graph_name in args.graphs:
+        results[graph_name] = {}
+        for threads in args.threads:
+            r = run(graph_name, threads, args.conversations, args.latency, customers, db_timer)
+            results[graph_name][str(threads)] = r
+            print(f"{graph_name:>10} x{threads:<3} {r['conversations_per_second']:7.1f} conv/s {r['turns_per_second']:7.1f} turns/s "
+                  f"{r['llm_calls']:5} LLM calls  db {r['db_ms_per_turn']:6.2f} ms/turn")
+            for node, n in r["nodes"].items():
+                print(f"{'':>16}{node:<20} {n['calls']:6} runs  mean {n['mean_ms']:8.2f} ms  p95 {n['p95_ms']:8.2f} ms")
+
+    summary.background_summaries.shutdown(wait=True)
+    output = {
+        "conversations": args.conversations,
+        "latency": args.latency,
+        "budget": args.budget,
+        "summary_mode": summary.SUMMARY_MODE,
+        "db_mode": core.CHINOOK_DB_MODE,
+        "results": results,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.loads(f.read().strip().splitlines()[-1])
+        regressions = compare(results, baseline, args.tolerance)
+    print(json.dumps(output))
+    if regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""make_sql_query throughput as the number of concurrent graph threads grows.
+
+Each thread makes the same mix of make_sql_query calls the graphs make, through tools.run_sql_batch:
+the cost guard, fetch_page with its time budget and page limits, and, for a call with several
+reads, the fan-out onto the reader pool. It compares the single shared connection
+(CHINOOK_DB_MODE=snapshot) with the WAL reader pool (CHINOOK_DB_MODE=pool, CHINOOK_POOL_SIZE set to
+the largest thread count). Each mode runs in a fresh subprocess configured through the environment,
+the same way the graphs are, with QUERY_CACHE_SIZE=0 so every statement reaches the database.
+Run from the studio directory:
+
+    python benchmarks/bench_pool.py --threads 1 2 4 8 --seconds 3
+
+The last line of output is json.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+STUDIO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, STUDIO_DIR)
+
+# One entry per make_sql_query call, the last one a batch the pool can fan out
+CALLS = [
+    ["SELECT InvoiceId, InvoiceDate, Total FROM Invoice WHERE CustomerId = {customer_id} ORDER BY InvoiceDate DESC LIMIT 5;"],
+    ["SELECT g.Name, COUNT(*) AS Tracks FROM Track t JOIN Genre g ON t.GenreId = g.GenreId GROUP BY g.Name ORDER BY Tracks DESC;"],
+    ["SELECT ar.Name, SUM(il.UnitPrice * il.Quantity) AS Revenue FROM InvoiceLine il JOIN Track t ON il.TrackId = t.TrackId "
+     "JOIN Album al ON t.AlbumId = al.AlbumId JOIN Artist ar ON al.ArtistId = ar.ArtistId GROUP BY ar.Name ORDER BY Revenue DESC LIMIT 10;"],
+    ["SELECT Name FROM Track WHERE Name LIKE '%love%';"],
+    [
+        "SELECT COUNT(*) AS Invoices, SUM(Total) AS Spent FROM Invoice WHERE CustomerId = {customer_id};",
+        "SELECT t.Name, il.UnitPrice FROM InvoiceLine il JOIN Invoice i ON i.InvoiceId = il.InvoiceId "
+        "JOIN Track t ON t.TrackId = il.TrackId WHERE i.CustomerId = {customer_id};",
+        "SELECT al.Title FROM Album al JOIN Artist ar ON ar.ArtistId = al.ArtistId ORDER BY al.Title;",
+    ],
+]
+
+def run(threads: int, seconds: float) -> dict:
+    """make_sql_query calls from the given number of threads, returns calls and statements per second."""
+    from catalog import get_catalog
+    from tools import run_sql_batch
+
+    get_catalog() # built once up front, like the first request of a running server
+    calls = [0] * threads
+    statements = [0] * threads
+    deadline = time.perf_counter() + seconds
+    start = threading.Barrier(threads + 1)
+
+    def worker(i):
+        start.wait()
+        n = 0
+        while time.perf_counter() < deadline:
+            sql_queries = [q.format(customer_id=1 + (i + n) % 50) for q in CALLS[n % len(CALLS)]]
+            run_sql_batch(sql_queries, 1 + (i + n) % 50)
+            statements[i] += len(sql_queries)
+            n += 1
+        calls[i] = n
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    started = time.perf_counter()
+    start.wait()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+    return {"calls_per_second": sum(calls) / elapsed, "statements_per_second": sum(statements) / elapsed}
+
+def child(args):
+    print(json.dumps({threads: run(threads, args.seconds) for threads in args.threads}))
+
+def run_mode(mode: str, threads: list, seconds: float) -> dict:
+    """Run every thread count for one mode in a subprocess and return its results."""
+    env = dict(os.environ, CHINOOK_DB_MODE=mode, CHINOOK_POOL_SIZE=str(max(threads)), QUERY_CACHE_SIZE="0")
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--seconds", str(seconds), "--threads", *map(str, threads)]
+    output = subprocess.run(command, capture_output=True, text=True, cwd=STUDIO_DIR, env=env)
+    if output.returncode != 0:
+        raise RuntimeError(f"{mode} run failed:\n{output.stderr}")
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--modes", nargs="+", default=["snapshot", "pool"])
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    results = {}
+    for mode in args.modes:
+        results[mode] = run_mode(mode, args.threads, args.seconds)
+        for threads, r in results[mode].items():
+            print(f"{mode:>9} threads={threads:<3} {r['calls_per_second']:9.1f} make_sql_query calls/s {r['statements_per_second']:9.1f} statements/s")
+
+    print(json.dumps(results))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Startup time and peak RSS for loading all three graphs.
+
+Each mode runs in a fresh subprocess so imports and memory are measured from a cold start:
+
+    per-graph  what the graphs used to do, one engine + SQLDatabase + model per graph file
+    shared     import agent.py, sql_agent.py and info_agent.py and warm the shared core and catalog once
+
+Run from the studio directory, CHINOOK_DB_MODE (snapshot, mmap or script) is passed through to the children:
+
+    python benchmarks/bench_startup.py --repeat 3
+    CHINOOK_DB_MODE=script python benchmarks/bench_startup.py
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+STUDIO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, os, resource, sys, time
+sys.path.insert(0, {studio_dir!r})
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+start = time.perf_counter()
+if {mode!r} == "per-graph":
+    # same library imports as the graph files, only the db/model construction differs
+    import langgraph.graph, langgraph.prebuilt, langchain_core.tools
+    from langchain_community.utilities.sql_database import SQLDatabase
+    import core
+    for _ in range(3):
+        engine = core.get_engine_for_chinook_db()
+        SQLDatabase(engine)
+        core.build_model()
+else:
+    import agent, sql_agent, info_agent
+    import core
+    from catalog import get_catalog
+    get_catalog()
+    core.get_model()
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}}))
+"""
+
+def run_mode(mode: str) -> dict:
+    """Run one cold start in a subprocess and return its timings."""
+    code = CHILD.format(studio_dir=STUDIO_DIR, mode=mode)
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=STUDIO_DIR)
+    if output.returncode != 0:
+        raise RuntimeError(f"{mode} run failed:\n{output.stderr}")
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--modes", nargs="+", default=["per-graph", "shared"])
+    args = parser.parse_args()
+
+    results = {}
+    for mode in args.modes:
+        runs = [run_mode(mode) for _ in range(args.repeat)]
+        results[mode] = {
+            "best_seconds": min(r["seconds"] for r in runs),
+            "max_rss_mb": max(r["max_rss_kb"] for r in runs) / 1024,
+        }
+        print(f"{mode:>10}: {results[mode]['best_seconds']:.3f}s, {results[mode]['max_rss_mb']:.1f} MB peak RSS")
+
+    print(json.dumps(results))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Per-turn latency and LLM spend for each SUMMARY_MODE.
+
+Runs `--turns` signed-in turns on one thread of sql_agent.py's graph with an in-memory checkpointer,
+once per mode, and reports the mean and p95 time until the graph returns the answer, plus model calls
+and approximate prompt tokens. `--budget` sets SUMMARY_TOKEN_BUDGET; use 0 to summarize on every turn
+like the graph used to. Run from the studio directory:
+
+    python benchmarks/bench_summary.py --turns 30 --latency 0.2 --budget 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from fake_model import FakeChatModel
+import core
+import summary
+import sql_agent
+
+def run_mode(mode: str, turns: int, latency: float) -> dict:
+    summary.SUMMARY_MODE = mode
+    model = FakeChatModel(latency=latency)
+    core.set_model(model)
+    graph = sql_agent.builder.compile(checkpointer=InMemorySaver())
+    config = {"configurable": {"thread_id": f"bench-{mode}"}}
+
+    latencies = []
+    for turn in range(turns):
+        update = {"messages": [HumanMessage(content=f"How many invoices do I have? ({turn})")]}
+        if turn == 0:
+            update.update(customer_id=1, customer_name="Bench")
+        start = time.perf_counter()
+        graph.invoke(update, config)
+        latencies.append(time.perf_counter() - start)
+
+    summary.background_summaries.shutdown(wait=True) # let background work land in the counters
+    summary.background_summaries = summary.BackgroundSummaries()
+    return {
+        "mean_turn_seconds": statistics.mean(latencies),
+        "p95_turn_seconds": sorted(latencies)[int(0.95 * (len(latencies) - 1))],
+        "llm_calls": model.calls,
+        "prompt_tokens": model.prompt_tokens,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.2, help="simulated seconds per LLM call")
+    parser.add_argument("--budget", type=int, default=summary.SUMMARY_TOKEN_BUDGET)
+    parser.add_argument("--modes", nargs="+", default=["inline", "deferred", "background"])
+    args = parser.parse_args()
+
+    summary.SUMMARY_TOKEN_BUDGET = args.budget
+    results = {}
+    for mode in args.modes:
+        results[mode] = run_mode(mode, args.turns, args.latency)
+        r = results[mode]
+        print(f"{mode:>10}: mean {r['mean_turn_seconds']:.3f}s p95 {r['p95_turn_seconds']:.3f}s, "
+              f"{r['llm_calls']} LLM calls, ~{r['prompt_tokens']} prompt tokens")
+    print(json.dumps({"turns": args.turns, "latency": args.latency, "budget": args.budget, **results}))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Deterministic local stand-ins for ChatOpenAI, so the graphs can be benchmarked without an endpoint.
+
+The reply depends only on the conversation it is given, so one instance can serve many concurrent
+threads. `latency` simulates the provider round-trip, with time.sleep on the sync path and
+asyncio.sleep on the async one.
+
+FakeChatModel answers every turn with the same query. ScriptedChatModel replays recorded replies
+per user message, built from say, call and next_page, see scenarios.py.
+"""
+import asyncio
+import itertools
+import re
+import time
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+_call_ids = itertools.count()
+
+class FakeChatModel(BaseChatModel):
+    """Answers a human turn with one make_sql_query call, then replies in text once the tool result is back."""
+
+    latency: float = 0.0
+    sql_query: str = "SELECT COUNT(*) AS Invoices FROM Invoice;"
+
+    # what a provider would bill for, approximately
+    calls: int = 0
+    prompt_tokens: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def respond(self, messages) -> AIMessage:
+        prompt_tokens = count_tokens_approximately(messages)
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        last = messages[-1]
+        if isinstance(last, HumanMessage) and "summary" in last.content.lower():
+            response = AIMessage(content="The customer asked about their account and got an answer.")
+        else:
+            response = self.reply(messages)
+        completion_tokens = count_tokens_approximately([response])
+        response.usage_metadata = {
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        return response
+
+    def reply(self, messages) -> AIMessage:
+        last = messages[-1]
+        if isinstance(last, ToolMessage):
+            return AIMessage(content=f"Here is what I found: {last.content[:80]}")
+        return AIMessage(
+            content="",
+            tool_calls=[{"name": "make_sql_query", "args": {"sql_queries": [self.sql_query]}, "id": f"call_{next(_call_ids)}"}],
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self.respond(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self.respond(messages))])
+
+# Script steps: each is a function from the conversation so far to the model's reply. Strings in
+# them may use {customer_id}, read from the system prompt, and {email}, read from the user's message
+
+def _context(messages) -> dict:
+    context = {}
+    for message in messages:
+        if message.type == "system":
+            match = re.search(r"customer's ID is (\d+)", message.content)
+            if match:
+                context["customer_id"] = match.group(1)
+        elif message.type == "human":
+            match = re.search(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+", message.content)
+            if match:
+                context["email"] = match.group(0)
+    return context
+
+class as_int(str):
+    """A template that fills in as an int, for integer tool arguments like customer_id."""
+
+def _fill(value, context: dict):
+    if isinstance(value, as_int):
+        return int(_fill(str(value), context))
+    if isinstance(value, str):
+        for key, replacement in context.items():
+            value = value.replace("{" + key + "}", replacement)
+        return value
+    if isinstance(value, list):
+        return [_fill(item, context) for item in value]
+    return value
+
+def _tool_call(name: str, args: dict) -> AIMessage:
+    return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": f"call_{next(_call_ids)}"}])
+
+def say(text: str):
+    """Reply in text."""
+    return lambda messages: AIMessage(content=_fill(text, _context(messages)))
+
+def call(name: str, **args):
+    """Call one tool."""
+    def step(messages):
+        context = _context(messages)
+        return _tool_call(name, {key: _fill(value, context) for key, value in args.items()})
+    return step
+
+def after_tool(prefix: str, text: str):
+    """Reply in text once the newest tool result starts with prefix. Raises otherwise, so a
+    scenario cannot carry on past a tool call that failed."""
+    def step(messages):
+        result = next((m for m in reversed(messages) if isinstance(m, ToolMessage)), None)
+        if result is None or not str(result.content).startswith(prefix):
+            raise AssertionError(f"expected a tool result starting with {prefix!r}, got {result and result.content!r}")
+        return AIMessage(content=_fill(text, _context(messages)))
+    return step
+
+def next_page(otherwise: str = "That was everything."):
+    """Ask fetch_more_rows for the page after the newest result that has one, or reply in text."""
+    def step(messages):
+        for message in reversed(messages):
+            if isinstance(message, ToolMessage):
+                match = re.search(r"fetch_more_rows with handle (\S+) ", str(message.content))
+                if match:
+                    return _tool_call("fetch_more_rows", {"handle": match.group(1)})
+        return AIMessage(content=otherwise)
+    return step
+
+class ScriptedChatModel(FakeChatModel):
+    """Replays recorded replies. `scripts` maps the start of a user message to the replies the model
+    gives in that turn, in order. A turn is matched by its user message and the step by how many AI
+    messages follow it, so a reply the graph produced without the model (the sign-in fast path)
+    takes its step's place. Past the end of a script, or for an unknown message, it falls back to
+    FakeChatModel's single query."""
+
+    scripts: dict = {}
+
+    def reply(self, messages) -> AIMessage:
+        turn = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=None)
+        if turn is not None:
+            text = messages[turn].content
+            steps = next((steps for prefix, steps in self.scripts.items() if text.startswith(prefix)), None)
+            step = sum(isinstance(m, AIMessage) for m in messages[turn + 1:])
+            if steps is not None and step < len(steps):
+                return steps[step](messages)
+        return super().reply(messages)
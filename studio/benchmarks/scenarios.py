@@ -0,0 +1,99 @@
+"""Recorded conversations for ScriptedChatModel.
+
+SCRIPTS maps the start of each user message to the model's replies in that turn. SCENARIOS are the
+user messages of whole conversations, in order:
+
+    sign_in        greet, give an email, confirm the account at the interrupt
+    browse         search the catalogue and page through the result
+    purchases      invoices, the tracks on the last one and spend per genre
+    long           browse and purchases over and over, enough for the summarizer to kick in
+    buy            look at an album and buy two of its tracks, confirmed at the interrupt
+    explore        one turn of schema lookups (one table twice) and queries before the answer
+
+{email} in a user message is replaced with the conversation's customer email.
+"""
+from fake_model import after_tool, as_int, call, next_page, say
+
+ROCK_ALBUMS = (
+    "SELECT al.Title, ar.Name AS Artist FROM Album al JOIN Artist ar ON ar.ArtistId = al.ArtistId "
+    "WHERE al.AlbumId IN (SELECT t.AlbumId FROM Track t JOIN Genre g ON g.GenreId = t.GenreId WHERE g.Name = 'Rock') "
+    "ORDER BY al.Title;"
+)
+ALBUM_TRACKS = (
+    "SELECT t.Name, t.Milliseconds / 1000 AS Seconds, t.UnitPrice FROM Track t "
+    "WHERE t.AlbumId = (SELECT MIN(AlbumId) FROM Album) ORDER BY t.TrackId;"
+)
+RECENT_INVOICES = "SELECT InvoiceId, InvoiceDate, Total FROM Invoice WHERE CustomerId = {customer_id} ORDER BY InvoiceDate DESC LIMIT 5;"
+INVOICE_SUMMARY = "SELECT COUNT(*) AS Invoices, SUM(Total) AS Spent FROM Invoice WHERE CustomerId = {customer_id};"
+LAST_INVOICE_TRACKS = (
+    "SELECT t.Name, il.UnitPrice, il.Quantity FROM InvoiceLine il JOIN Track t ON t.TrackId = il.TrackId "
+    "WHERE il.InvoiceId = (SELECT InvoiceId FROM Invoice WHERE CustomerId = {customer_id} ORDER BY InvoiceDate DESC LIMIT 1);"
+)
+SPEND_BY_GENRE = (
+    "SELECT g.Name AS Genre, SUM(il.UnitPrice * il.Quantity) AS Spent FROM Invoice i "
+    "JOIN InvoiceLine il ON il.InvoiceId = i.InvoiceId JOIN Track t ON t.TrackId = il.TrackId "
+    "JOIN Genre g ON g.GenreId = t.GenreId WHERE i.CustomerId = {customer_id} GROUP BY g.Name ORDER BY Spent DESC;"
+)
+
+SCRIPTS = {
+    "Hello!": [say("Hi there! Could you tell me the email address on your account?")],
+    # step 0 only runs if the sign-in fast path misses the address
+    "Sure, it's ": [call("get_customer_info", email="{email}"), say("Thanks, you're signed in. How can I help?")],
+    "What rock albums do you have?": [
+        call("get_table_info", table_names=["Album", "Artist", "Genre", "Track"]),
+        call("make_sql_query", sql_queries=[ROCK_ALBUMS]),
+        say("Here are the rock albums we stock."),
+    ],
+    "Show me more": [next_page(), say("Here are some more.")],
+    "Which tracks are on the first one?": [
+        call("make_sql_query", sql_queries=[ALBUM_TRACKS]),
+        say("These are the tracks on that album."),
+    ],
+    "What have I bought recently?": [
+        call("make_sql_query", sql_queries=[RECENT_INVOICES, INVOICE_SUMMARY]),
+        say("Here are your latest invoices and what you have spent in total."),
+    ],
+    "Which tracks were on my last invoice?": [
+        call("make_sql_query", sql_queries=[LAST_INVOICE_TRACKS]),
+        say("These are the tracks from your last order."),
+    ],
+    "Buy the first two tracks": [
+        call("create_invoice", customer_id=as_int("{customer_id}"), track_ids=[1, 2]),
+        after_tool("Created invoice", "Done, they are on a new invoice."),
+    ],
+    "How much have I spent on each genre?": [
+        call("make_sql_query", sql_queries=[SPEND_BY_GENRE]),
+        say("Here is your spend per genre."),
+    ],
+    # a model feeling its way through the schema, one call at a time
+    "Tell me about my listening habits": [
+        call("get_table_info", table_names=["Invoice", "InvoiceLine"]),
+        call("make_sql_query", sql_queries=[RECENT_INVOICES]),
+        call("get_table_info", table_names=["InvoiceLine", "Track", "Genre"]),
+        call("make_sql_query", sql_queries=[SPEND_BY_GENRE]),
+        call("make_sql_query", sql_queries=[LAST_INVOICE_TRACKS]),
+        call("make_sql_query", sql_queries=[ROCK_ALBUMS]),
+        say("You mostly buy rock, here is what you bought lately and some rock albums you might like."),
+    ],
+}
+
+BROWSE = ["What rock albums do you have?", "Show me more", "Which tracks are on the first one?"]
+PURCHASES = ["What have I bought recently?", "Which tracks were on my last invoice?", "How much have I spent on each genre?"]
+
+SCENARIOS = {
+    "sign_in": ["Hello!", "Sure, it's {email}"],
+    "browse": BROWSE,
+    "purchases": PURCHASES,
+    "buy": ["Which tracks are on the first one?", "Buy the first two tracks"],
+    "explore": ["Tell me about my listening habits", "What have I bought recently?"],
+    # numbered so every turn is a new message, the script still matches on the start
+    "long": [f"{text} ({n})" for n in range(4) for text in BROWSE + PURCHASES],
+}
+
+# Which scenarios each graph can run. agent.py signs in before anything else, sql_agent.py starts
+# signed in and info_agent.py only does the sign-in
+GRAPH_SCENARIOS = {
+    "agent": ["sign_in", "browse", "purchases", "long", "buy", "explore"],
+    "sql_agent": ["browse", "purchases", "long", "buy", "explore"],
+    "info_agent": ["sign_in"],
+}
@@ -0,0 +1,115 @@
+"""LRU/TTL result cache in front of make_sql_query.
+
+Entries are keyed on (customer_id, normalized sql), so one customer's rows are never served to
+another, and remember which tables the query mentions so a write to any of them drops the entry.
+Size and TTL come from QUERY_CACHE_SIZE and QUERY_CACHE_TTL; QUERY_CACHE_SIZE=0 turns it off.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+# Quoted strings and identifiers are kept verbatim, everything between them is case-folded and
+# has its whitespace collapsed (sqlite keywords and bare identifiers are case-insensitive)
+_SQL_TOKENS = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*"|\[[^\]]*\]|`[^`]*`)|([^'"\[`]+)""")
+
+def normalize_sql(sql_query: str) -> str:
+    """Normalize a statement so trivially different spellings of the same query share a key."""
+    def replace(match):
+        if match.group(1):
+            return match.group(1)
+        return re.sub(r"\s+", " ", match.group(2).lower())
+    return _SQL_TOKENS.sub(replace, sql_query).strip().rstrip(";").strip()
+
+def tables_in(sql_query: str, table_names: Iterable[str]) -> frozenset:
+    """Known table names that appear in a statement, matched case-insensitively as whole words."""
+    lowered = sql_query.lower()
+    return frozenset(
+        name for name in table_names
+        if re.search(r"(?<![\w$])" + re.escape(name.lower()) + r"(?![\w$])", lowered)
+    )
+
+class QueryCache:
+    """Thread-safe LRU cache with a per-entry TTL and hit/miss/eviction counters."""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict() # key -> (expires_at, tables, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.generation = 0 # bumped on every invalidation, see put()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get(self, customer_id, sql_query: str):
+        """Return the cached value, or None on a miss."""
+        key = (customer_id, normalize_sql(sql_query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, customer_id, sql_query: str, tables: frozenset, value, generation: int = None):
+        """Store value. Pass the generation read before running the query, so a result that raced
+        with a write is not cached."""
+        if not self.enabled:
+            return
+        key = (customer_id, normalize_sql(sql_query))
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, tables, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, tables: Optional[Iterable[str]] = None):
+        """Drop every entry that mentions one of tables, or everything if tables is None."""
+        with self._lock:
+            if tables is None:
+                dropped = list(self._entries)
+            else:
+                tables = set(tables)
+                dropped = [key for key, entry in self._entries.items() if entry[1] & tables]
+            for key in dropped:
+                del self._entries[key]
+            self.invalidations += len(dropped)
+            self.generation += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+query_cache = QueryCache(
+    max_size=int(os.environ.get("QUERY_CACHE_SIZE", "1024")),
+    ttl=float(os.environ.get("QUERY_CACHE_TTL", "300")),
+)
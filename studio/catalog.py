@@ -0,0 +1,112 @@
+"""Schema catalog built once from the database and served from memory.
+
+Table names, columns, keys, sample rows and row counts are read with a handful of sqlite PRAGMAs on first use,
+instead of reflecting through SQLAlchemy every time the model calls get_table_info. The catalog
+also pre-renders a compact schema digest for the system prompt. Call invalidate() after DDL.
+"""
+import threading
+from typing import NamedTuple
+from sqlalchemy.engine import Engine
+from core import get_engine
+from search import SEARCH_TABLE_PREFIX
+
+SAMPLE_ROWS = 3
+
+class TableSchema(NamedTuple):
+    name: str
+    create_sql: str
+    columns: list # (name, type, not_null, is_primary_key)
+    foreign_keys: list # (column, ref_table, ref_column)
+    sample: list # rows as tuples
+    row_count: int = 0 # at build time, the SQL guard's cost estimates only need a rough figure
+
+    def render(self) -> str:
+        """CREATE statement plus sample rows, in the same layout as SQLDatabase.get_table_info."""
+        header = "\t".join(column[0] for column in self.columns)
+        rows = "\n".join("\t".join(str(value)[:100] for value in row) for row in self.sample)
+        return f"\n{self.create_sql}\n\n/*\n{len(self.sample)} rows from {self.name} table:\n{header}\n{rows}\n*/"
+
+    def digest(self) -> str:
+        """One line, e.g. Invoice(InvoiceId PK, CustomerId->Customer.CustomerId, Total)."""
+        references = {column: f"{table}.{ref}" for column, table, ref in self.foreign_keys}
+        parts = []
+        for name, _, _, is_primary_key in self.columns:
+            if is_primary_key:
+                parts.append(f"{name} PK")
+            elif name in references:
+                parts.append(f"{name}->{references[name]}")
+            else:
+                parts.append(name)
+        return f"{self.name}({', '.join(parts)})"
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+class SchemaCatalog:
+    """In-memory schema for every user table."""
+
+    def __init__(self, tables: dict):
+        self.tables = tables
+        self.table_names = sorted(tables)
+        self.digest = "\n".join(tables[name].digest() for name in self.table_names)
+        self.row_counts = {name: table.row_count for name, table in tables.items()}
+
+    @classmethod
+    def build(cls, engine: Engine) -> "SchemaCatalog":
+        tables = {}
+        with engine.connect() as connection:
+            # the search index and its FTS5 shadow tables are for search_catalogue, not the model
+            master = connection.exec_driver_sql(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' "
+                "AND substr(name, 1, ?) != ? ORDER BY name",
+                (len(SEARCH_TABLE_PREFIX), SEARCH_TABLE_PREFIX),
+            ).fetchall()
+            for name, create_sql in master:
+                quoted = _quote(name)
+                columns = [
+                    (row[1], row[2], bool(row[3]), bool(row[5]))
+                    for row in connection.exec_driver_sql(f"PRAGMA table_info({quoted})")
+                ]
+                foreign_keys = [
+                    (row[3], row[2], row[4])
+                    for row in connection.exec_driver_sql(f"PRAGMA foreign_key_list({quoted})")
+                ]
+                sample = [tuple(row) for row in connection.exec_driver_sql(f"SELECT * FROM {quoted} LIMIT {SAMPLE_ROWS}")]
+                row_count = connection.exec_driver_sql(f"SELECT COUNT(*) FROM {quoted}").scalar()
+                tables[name] = TableSchema(name, create_sql, columns, foreign_keys, sample, row_count)
+        return cls(tables)
+
+    def table_info(self, table_names) -> str:
+        """Rendered schema for one or more tables, raising ValueError for unknown names."""
+        if isinstance(table_names, str):
+            table_names = [table_names]
+        missing = [name for name in table_names if name not in self.tables]
+        if missing:
+            raise ValueError(f"table_names {set(missing)} not found in database")
+        return "\n\n".join(self.tables[name].render() for name in table_names)
+
+# Lazy singleton, built on first use and dropped by invalidate()
+_lock = threading.Lock()
+_catalog = None
+
+def get_catalog() -> SchemaCatalog:
+    """Return the shared catalog, building it from the read engine on first use."""
+    global _catalog
+    catalog = _catalog
+    if catalog is None:
+        with _lock:
+            if _catalog is None:
+                _catalog = SchemaCatalog.build(get_engine())
+            catalog = _catalog
+    return catalog
+
+def invalidate():
+    """Forget the catalog so the next get_catalog() re-reads the schema."""
+    global _catalog
+    with _lock:
+        _catalog = None
+
+def is_schema_change(sql_query: str) -> bool:
+    """Whether a statement can change the schema, and so should invalidate the catalog."""
+    words = sql_query.lstrip(" \t\n\r(").split(None, 1)
+    return bool(words) and words[0].upper() in ("CREATE", "ALTER", "DROP")
@@ -0,0 +1,484 @@
+"""SQLite checkpointer for running the graphs without the LangGraph platform.
+
+Set CHECKPOINT_PATH and every graph compiles with one shared SqliteCheckpointer on that file.
+Leave it empty and the graphs compile without one, as before, for the platform to supply its own.
+
+A conversation checkpoints several times per turn, so the saver is built for many small writes:
+
+    batched     put and put_writes only queue their rows. A flusher thread commits everything queued
+                every CHECKPOINT_FLUSH_INTERVAL seconds in one transaction. Rows for the same key
+                coalesce in the queue, and a read of a conversation with rows queued commits them
+                first, so reads always see the writes before them. 0 commits on every call instead. On a crash the last interval is lost,
+                on power loss also the last WAL commits (synchronous=NORMAL). A batch that fails to
+                commit goes back into the queue and is retried every RETRY_DELAY seconds, so no row
+                a later delta builds on is ever dropped
+    compact     values are serialized by the graph's serializer (msgpack) and blobs over
+                COMPRESS_OVER bytes are zlib-compressed, on the flusher thread
+    deltas      a channel is only stored when its version changes, and a list channel (messages)
+                that only grew since its last stored version is stored as just the new items on
+                top of that version. Every CHECKPOINT_KEYFRAME_EVERY versions, and whenever the list
+                changed in any other way (a summary removed messages), the full list is stored
+
+interrupt() needs nothing special: the interrupt is a pending write, and the get_tuple at the
+start of the resuming invoke commits it before reading.
+"""
+import asyncio
+import atexit
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Iterator, Optional, Sequence
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+    writes_sort_key,
+)
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_PATH = os.environ.get("CHECKPOINT_PATH", "")
+CHECKPOINT_FLUSH_INTERVAL = float(os.environ.get("CHECKPOINT_FLUSH_INTERVAL", "0.005"))
+CHECKPOINT_KEYFRAME_EVERY = int(os.environ.get("CHECKPOINT_KEYFRAME_EVERY", "32"))
+COMPRESS_OVER = 512
+HEADS_SIZE = 4096 # list channels whose last stored value is kept to diff against
+RETRY_DELAY = 0.5 # seconds before the flusher tries a failed batch again
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    checkpoint BLOB NOT NULL,
+    metadata BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    base_version TEXT, -- set for a delta, the version whose value it appends to
+    blob BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    blob BLOB NOT NULL,
+    task_path TEXT NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+) WITHOUT ROWID;
+"""
+
+# A blob and the deltas it is built on, newest first, ending at the full value
+_CHAIN_SQL = """
+WITH RECURSIVE chain(depth, base_version, blob) AS (
+    SELECT 0, base_version, blob FROM blobs
+    WHERE thread_id = ?1 AND checkpoint_ns = ?2 AND channel = ?3 AND version = ?4
+    UNION ALL
+    SELECT chain.depth + 1, b.base_version, b.blob FROM chain JOIN blobs b
+    ON b.thread_id = ?1 AND b.checkpoint_ns = ?2 AND b.channel = ?3 AND b.version = chain.base_version
+)
+SELECT base_version, blob FROM chain ORDER BY depth
+"""
+
+def _pack(typed: tuple) -> bytes:
+    """One serialized (type, bytes) as a blob: a compression flag, the type, a NUL, the data."""
+    type_, data = typed
+    flag = b"\x00"
+    if len(data) > COMPRESS_OVER:
+        compressed = zlib.compress(data, 1)
+        if len(compressed) < len(data):
+            flag, data = b"\x01", compressed
+    return flag + type_.encode() + b"\x00" + data
+
+def _unpack(blob: bytes) -> tuple:
+    type_, data = bytes(blob[1:]).split(b"\x00", 1)
+    if blob[0] == 1:
+        data = zlib.decompress(data)
+    return type_.decode(), data
+
+def _extends(old: tuple, new: list) -> bool:
+    return len(new) >= len(old) and all(a is b or a == b for a, b in zip(old, new))
+
+class _Batch:
+    """Rows waiting for the next commit, keyed by primary key so a re-written row replaces the queued one."""
+
+    def __init__(self):
+        self.checkpoints = {}
+        self.blobs = {}
+        self.writes = {}
+        self.threads = set()
+
+    def __bool__(self):
+        return bool(self.checkpoints or self.blobs or self.writes)
+
+    def put_back(self, newer: "_Batch") -> "_Batch":
+        """This batch, which failed to commit, merged with the rows queued since. Newer rows win,
+        except regular writes, which are written once."""
+        merged = _Batch()
+        merged.checkpoints = {**self.checkpoints, **newer.checkpoints}
+        merged.blobs = {**self.blobs, **newer.blobs}
+        merged.writes = {**newer.writes, **{key: row for key, row in self.writes.items() if key[4] >= 0}}
+        merged.writes.update((key, row) for key, row in self.writes.items() if key[4] < 0 and key not in newer.writes)
+        merged.threads = self.threads | newer.threads
+        return merged
+
+class SqliteCheckpointer(BaseCheckpointSaver[str]):
+    """Checkpoints, channel values and pending writes in one WAL-mode sqlite file."""
+
+    def __init__(self, path: str, *, flush_interval: float = CHECKPOINT_FLUSH_INTERVAL,
+                 keyframe_every: int = CHECKPOINT_KEYFRAME_EVERY, serde=None):
+        super().__init__(serde=serde)
+        self.path = path
+        self.flush_interval = flush_interval
+        self.keyframe_every = keyframe_every
+
+        self._writer = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        self._writer.execute("PRAGMA synchronous=NORMAL")
+        self._writer.executescript(_SCHEMA)
+        self._readers = threading.local()
+        self._write_lock = threading.Lock() # the writer connection, one batch at a time
+
+        self._cond = threading.Condition()
+        self._batch = _Batch()
+        self._committing = _Batch() # the batch being written, if any
+        self._queued = 0 # rows queued so far
+        self._written = 0 # of those, rows committed
+        self._closed = False
+        self._flusher = None
+        # (thread_id, checkpoint_ns, channel) -> (version, value, deltas since the last full value)
+        self._heads = OrderedDict()
+        self.batches = 0
+        self.full_blobs = 0
+        self.delta_blobs = 0
+
+    # Writing
+
+    def _rows_queued(self, count: int):
+        """Count rows just added to the batch and wake the flusher. Call with _cond held."""
+        self._queued += count
+        if self.flush_interval > 0:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="checkpoint-flusher", daemon=True)
+                self._flusher.start()
+            self._cond.notify_all()
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._closed and self._queued == self._written:
+                    self._cond.wait()
+                if self._closed and self._queued == self._written:
+                    return
+            time.sleep(self.flush_interval) # let the rest of the super-step queue up
+            try:
+                self._commit_queued()
+            except Exception:
+                # the rows are queued again, a flush() in the meantime retries straight away
+                logger.exception("Writing checkpoints to %s failed, retrying", self.path)
+                with self._cond:
+                    self._cond.wait(RETRY_DELAY)
+
+    def _commit_queued(self):
+        with self._write_lock:
+            with self._cond:
+                batch, self._batch = self._batch, _Batch()
+                self._committing = batch
+                queued = self._queued
+            try:
+                if batch:
+                    self._write_batch(batch)
+            except BaseException:
+                with self._cond:
+                    self._batch = batch.put_back(self._batch)
+                    self._committing = _Batch()
+                raise
+            with self._cond:
+                self._committing = _Batch()
+                self._written = max(self._written, queued)
+                self._cond.notify_all()
+
+    def _write_batch(self, batch: _Batch):
+        writes = [(*key, channel, _pack(typed), task_path) for key, (channel, typed, task_path) in batch.writes.items()]
+        connection = self._writer
+        connection.execute("BEGIN")
+        try:
+            connection.executemany(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?)",
+                [(*key, parent, _pack(checkpoint), _pack(metadata)) for key, (parent, checkpoint, metadata) in batch.checkpoints.items()],
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)",
+                [(*key, base, _pack(typed)) for key, (base, typed) in batch.blobs.items()],
+            )
+            # special writes (errors, interrupts) replace, regular ones are written once
+            connection.executemany("INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [w for w in writes if w[4] < 0])
+            connection.executemany("INSERT OR IGNORE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [w for w in writes if w[4] >= 0])
+            connection.execute("COMMIT")
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        self.batches += 1
+
+    def flush(self, thread_id: Optional[str] = None):
+        """Commit everything queued so far, or nothing if thread_id has no rows waiting. Raises if the
+        commit fails, the rows stay queued."""
+        with self._cond:
+            if thread_id is None:
+                pending = self._queued != self._written
+            else:
+                pending = thread_id in self._batch.threads or thread_id in self._committing.threads
+        if pending:
+            self._commit_queued()
+
+    def close(self):
+        """Flush and stop the flusher thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.flush()
+
+    def _blob_row(self, thread_id: str, checkpoint_ns: str, channel: str, version: str, value) -> tuple:
+        """(base_version, serialized) for a channel value: a delta on the last stored version if the
+        value is a list that only grew since, the whole value otherwise. Call with _cond held."""
+        key = (thread_id, checkpoint_ns, channel)
+        head = self._heads.pop(key, None)
+        if not isinstance(value, list):
+            self.full_blobs += 1
+            return None, self.serde.dumps_typed(value)
+
+        if head is not None and head[2] + 1 < self.keyframe_every and _extends(head[1], value):
+            row, depth = (head[0], self.serde.dumps_typed(value[len(head[1]):])), head[2] + 1
+            self.delta_blobs += 1
+        else:
+            row, depth = (None, self.serde.dumps_typed(value)), 0
+            self.full_blobs += 1
+        self._heads[key] = (version, tuple(value), depth)
+        if len(self._heads) > HEADS_SIZE:
+            self._heads.popitem(last=False)
+        return row
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint = checkpoint.copy()
+        values = checkpoint.pop("channel_values")
+
+        metadata = get_checkpoint_metadata(config, metadata)
+        with self._cond: # heads and the batch change together
+            for channel, version in new_versions.items():
+                if channel in values:
+                    row = self._blob_row(thread_id, checkpoint_ns, channel, version, values[channel])
+                else:
+                    row = (None, ("empty", b""))
+                self._batch.blobs[(thread_id, checkpoint_ns, channel, version)] = row
+            self._batch.threads.add(thread_id)
+            self._batch.checkpoints[(thread_id, checkpoint_ns, checkpoint["id"])] = (
+                config["configurable"].get("checkpoint_id"),
+                self.serde.dumps_typed(checkpoint),
+                self.serde.dumps_typed(metadata),
+            )
+            self._rows_queued(len(new_versions) + 1)
+        if self.flush_interval <= 0:
+            self.flush()
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[tuple], task_id: str, task_path: str = "") -> None:
+        configurable = config["configurable"]
+        rows = {}
+        for i, (channel, value) in enumerate(writes):
+            idx = WRITES_IDX_MAP.get(channel, i)
+            key = (configurable["thread_id"], configurable.get("checkpoint_ns", ""), configurable["checkpoint_id"], task_id, idx)
+            rows[key] = (channel, self.serde.dumps_typed(value), task_path)
+        with self._cond:
+            for key, row in rows.items():
+                # special writes (errors, interrupts) replace, regular ones are written once
+                if key[4] < 0 or key not in self._batch.writes:
+                    self._batch.writes[key] = row
+            self._batch.threads.add(configurable["thread_id"])
+            self._rows_queued(len(rows))
+        if self.flush_interval <= 0:
+            self.flush()
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.flush()
+        with self._write_lock:
+            self._writer.execute("BEGIN")
+            for table in ("checkpoints", "blobs", "writes"):
+                self._writer.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+            self._writer.execute("COMMIT")
+        with self._cond:
+            for key in [key for key in self._heads if key[0] == thread_id]:
+                del self._heads[key]
+
+    def get_next_version(self, current: Optional[str], channel: None = None) -> str:
+        # Same scheme as InMemorySaver: zero-padded counter, random fraction to break ties
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # Reading
+
+    def _reader(self) -> sqlite3.Connection:
+        connection = getattr(self._readers, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path)
+            self._readers.connection = connection
+        return connection
+
+    def _load_value(self, connection, thread_id: str, checkpoint_ns: str, channel: str, version: str):
+        """A channel's value at a version, applying deltas onto the full value they start from.
+        Returns (found, value)."""
+        rows = connection.execute(_CHAIN_SQL, (thread_id, checkpoint_ns, channel, version)).fetchall()
+        if not rows or rows[-1][0] is not None: # missing, or a delta whose base is gone
+            return False, None
+
+        typed = _unpack(rows[-1][1])
+        if typed[0] == "empty":
+            return False, None
+        value = self.serde.loads_typed(typed)
+        if len(rows) > 1:
+            value = list(value)
+            for _, blob in reversed(rows[:-1]):
+                value.extend(self.serde.loads_typed(_unpack(blob)))
+        return True, value
+
+    def _tuple(self, connection, thread_id: str, checkpoint_ns: str, checkpoint_id: str, parent_id, checkpoint_blob, metadata_blob) -> CheckpointTuple:
+        checkpoint = self.serde.loads_typed(_unpack(checkpoint_blob))
+        values = {}
+        for channel, version in checkpoint["channel_versions"].items():
+            found, value = self._load_value(connection, thread_id, checkpoint_ns, channel, version)
+            if found:
+                values[channel] = value
+
+        rows = connection.execute(
+            "SELECT task_id, idx, channel, blob, task_path FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        rows.sort(key=lambda row: writes_sort_key(row[4], row[0], row[1]))
+
+        def config_for(cid):
+            return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": cid}}
+
+        return CheckpointTuple(
+            config=config_for(checkpoint_id),
+            checkpoint={**checkpoint, "channel_values": values},
+            metadata=self.serde.loads_typed(_unpack(metadata_blob)),
+            parent_config=config_for(parent_id) if parent_id else None,
+            pending_writes=[(task_id, channel, self.serde.loads_typed(_unpack(blob))) for task_id, _, channel, blob, _ in rows],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        self.flush(thread_id)
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        connection = self._reader()
+        select = "SELECT checkpoint_id, parent_checkpoint_id, checkpoint, metadata FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+        if checkpoint_id:
+            row = connection.execute(select + " AND checkpoint_id = ?", (thread_id, checkpoint_ns, checkpoint_id)).fetchone()
+        else:
+            row = connection.execute(select + " ORDER BY checkpoint_id DESC LIMIT 1", (thread_id, checkpoint_ns)).fetchone()
+        if row is None:
+            return None
+        return self._tuple(connection, thread_id, checkpoint_ns, *row)
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[dict] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        self.flush()
+        where, parameters = [], []
+        if config:
+            where.append("thread_id = ?")
+            parameters.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                where.append("checkpoint_ns = ?")
+                parameters.append(config["configurable"]["checkpoint_ns"])
+            if get_checkpoint_id(config):
+                where.append("checkpoint_id = ?")
+                parameters.append(get_checkpoint_id(config))
+        if before and get_checkpoint_id(before):
+            where.append("checkpoint_id < ?")
+            parameters.append(get_checkpoint_id(before))
+
+        connection = self._reader()
+        rows = connection.execute(
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, checkpoint, metadata FROM checkpoints "
+            + (f"WHERE {' AND '.join(where)} " if where else "")
+            + "ORDER BY thread_id, checkpoint_ns, checkpoint_id DESC",
+            parameters,
+        ).fetchall()
+        for row in rows:
+            if limit is not None and limit <= 0:
+                return
+            # metadata is serialized, so it is filtered here rather than in sql
+            if filter:
+                metadata = self.serde.loads_typed(_unpack(row[5]))
+                if not all(metadata.get(key) == value for key, value in filter.items()):
+                    continue
+            if limit is not None:
+                limit -= 1
+            yield self._tuple(connection, *row)
+
+    # Async: writes only queue, reads run on a thread
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[dict] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None):
+        for item in await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit))):
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        if self.flush_interval <= 0:
+            return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[tuple], task_id: str, task_path: str = "") -> None:
+        if self.flush_interval <= 0:
+            return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+        return self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+# Lazy singleton shared by all three graphs
+_lock = threading.Lock()
+_checkpointer = None
+
+def get_checkpointer() -> Optional[SqliteCheckpointer]:
+    """The shared checkpointer on CHECKPOINT_PATH, or None when CHECKPOINT_PATH is not set."""
+    global _checkpointer
+    if not CHECKPOINT_PATH:
+        return None
+    with _lock:
+        if _checkpointer is None:
+            _checkpointer = SqliteCheckpointer(CHECKPOINT_PATH)
+            atexit.register(_checkpointer.close)
+    return _checkpointer
@@ -0,0 +1,142 @@
+"""Token-budgeted compaction of old tool results in the SQL model's prompt.
+
+Every sql_model_node -> sql_tools iteration sends the whole history again, so without this each
+get_table_info dump and query result is paid for on every later call of the turn, and of the turns
+after it. compact_tool_outputs rewrites the prompt copy of the history, never State:
+
+    - a get_table_info table that is fetched again further down is dropped from the earlier dump
+    - tool results the model has already answered (an AI message follows them) are kept in full,
+      newest first, while they fit COMPACT_TOKEN_BUDGET. Older ones become a digest: the
+      '-- [n] <query>' labels, the header and first DIGEST_ROWS rows of every result and the page
+      trailers (so a handle for fetch_more_rows survives), plus the result's tool_call_id as a
+      reference
+    - results the model has not seen yet are never touched
+
+recall_tool_output in tools.py returns the full text for a reference, read from State.
+
+Results only ever get older, so once a result is digested it stays digested and the prompt prefix
+before it stays cacheable. COMPACT_TOKEN_BUDGET=-1 turns compaction off.
+"""
+import json
+import os
+import threading
+from typing import Optional
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+COMPACT_TOKEN_BUDGET = int(os.environ.get("COMPACT_TOKEN_BUDGET", "1000"))
+COMPACT_MIN_TOKENS = 100 # a digest saves nothing on results smaller than this
+DIGEST_ROWS = 3 # rows kept after each header line, for "the first one" kind of follow-ups
+
+def _text(message: ToolMessage) -> str:
+    return message.content if isinstance(message.content, str) else str(message.content)
+
+def _table_info(message: ToolMessage):
+    """The {table: info} of a get_table_info result, or None if it is not one."""
+    if message.name != "get_table_info":
+        return None
+    try:
+        info = json.loads(_text(message))["table_info"]
+    except (ValueError, KeyError, TypeError):
+        return None
+    return info if isinstance(info, dict) else None
+
+def digest(message: ToolMessage) -> str:
+    """A few lines standing in for a tool result the model has already used."""
+    text = _text(message)
+    lines = text.splitlines()
+    info = _table_info(message)
+    if info is not None:
+        kept = [f"tables: {', '.join(info)}"]
+    else:
+        kept, since_header = [], 0
+        for line in lines:
+            if line.startswith("-- ["):
+                since_header = -1
+            elif since_header > DIGEST_ROWS and not line.startswith("("):
+                continue
+            kept.append(line)
+            since_header += 1
+    header = (f"[{message.name or 'tool'} result compacted: {len(lines)} lines, about "
+              f"{count_tokens_approximately([message])} tokens. recall_tool_output(\"{message.tool_call_id}\") returns it in full]")
+    return "\n".join([header] + kept)
+
+def _without_repeated_tables(messages: list, stats: dict) -> list:
+    """Drop tables from get_table_info dumps that a later dump includes again."""
+    seen = set()
+    result = list(messages)
+    for i in range(len(result) - 1, -1, -1):
+        message = result[i]
+        info = _table_info(message) if isinstance(message, ToolMessage) else None
+        if info is None:
+            continue
+        repeated = [table for table in info if table in seen]
+        seen.update(info)
+        if not repeated:
+            continue
+        stats["schemas_dropped"] += len(repeated)
+        kept = {table: value for table, value in info.items() if table not in repeated}
+        note = f"schema for {', '.join(repeated)} repeated further down"
+        content = json.dumps({"table_info": kept, "note": note}, ensure_ascii=False) if kept else f"[{note}]"
+        result[i] = message.model_copy(update={"content": content})
+    return result
+
+def compact_tool_outputs(messages: list, budget: Optional[int] = None) -> list:
+    """The history as the SQL model should see it, with stale tool results compacted."""
+    budget = COMPACT_TOKEN_BUDGET if budget is None else budget
+    if budget < 0:
+        return messages
+
+    stats = {"schemas_dropped": 0, "outputs_compacted": 0}
+    result = _without_repeated_tables(messages, stats)
+
+    # Only results followed by an AI message have been used
+    last_ai = max((i for i, m in enumerate(result) if isinstance(m, AIMessage)), default=-1)
+    remaining = budget
+    for i in range(last_ai - 1, -1, -1):
+        message = result[i]
+        if not isinstance(message, ToolMessage):
+            continue
+        tokens = count_tokens_approximately([message])
+        if tokens <= remaining:
+            remaining -= tokens
+        elif tokens >= COMPACT_MIN_TOKENS:
+            # once one result is over, every older one is digested too, so the choice is stable
+            remaining = 0
+            result[i] = message.model_copy(update={"content": digest(message)})
+            stats["outputs_compacted"] += 1
+
+    compaction_stats.record(count_tokens_approximately(messages), count_tokens_approximately(result), **stats)
+    return result
+
+class CompactionStats:
+    """Running totals of history tokens sent to the SQL model, before and after compaction."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.outputs_compacted = 0
+        self.schemas_dropped = 0
+
+    def record(self, tokens_before: int, tokens_after: int, outputs_compacted: int, schemas_dropped: int):
+        with self._lock:
+            self.calls += 1
+            self.tokens_before += tokens_before
+            self.tokens_after += tokens_after
+            self.outputs_compacted += outputs_compacted
+            self.schemas_dropped += schemas_dropped
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "tokens_before": self.tokens_before,
+                "tokens_after": self.tokens_after,
+                "tokens_saved": self.tokens_before - self.tokens_after,
+                "outputs_compacted": self.outputs_compacted,
+                "schemas_dropped": self.schemas_dropped,
+            }
+
+compaction_stats = CompactionStats()
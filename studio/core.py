@@ -0,0 +1,249 @@
+import asyncio
+import functools
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import snapshot
+from langchain_openai import ChatOpenAI
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+
+# Shared database and model core for all three graphs.
+# langgraph.json loads agent.py, sql_agent.py and info_agent.py into the same process,
+# so everything here is built once, on first use, and then re-used by every graph.
+
+CHINOOK_SQL_URL = os.environ.get(
+    "CHINOOK_SQL_URL",
+    "https://raw.githubusercontent.com/lerocha/chinook-database/master/ChinookDatabase/DataSources/Chinook_Sqlite.sql",
+)
+MODEL_NAME = os.environ.get("MODEL_NAME", "gpt-5-nano")
+
+# How the database is brought up:
+#   snapshot  load the checksummed snapshot file into memory (built from the sql script the first time)
+#   mmap      open the snapshot file read-only and memory-mapped, shared between worker processes
+#   script    download and execute the sql script on every boot
+#   pool      WAL working copy of the snapshot with CHINOOK_POOL_SIZE reader connections and a single writer
+CHINOOK_DB_MODE = os.environ.get("CHINOOK_DB_MODE", "snapshot")
+CHINOOK_SNAPSHOT_PATH = os.environ.get("CHINOOK_SNAPSHOT_PATH", snapshot.DEFAULT_SNAPSHOT_PATH)
+CHINOOK_POOL_SIZE = int(os.environ.get("CHINOOK_POOL_SIZE", "4"))
+
+def fetch_chinook_sql() -> str:
+    """Download the Chinook sql script."""
+    response = requests.get(CHINOOK_SQL_URL)
+    response.raise_for_status()
+    return response.text
+
+def connect_chinook_db(mode: str = None) -> sqlite3.Connection:
+    """Return a sqlite3 connection to the Chinook database for the given mode."""
+    mode = mode or CHINOOK_DB_MODE
+
+    if mode == "script":
+        connection = sqlite3.connect(":memory:", check_same_thread=False)
+        connection.executescript(fetch_chinook_sql()) # high-level wrapper around our connection, this will now be the central object which represents the db
+        snapshot.apply_indexes(connection)
+        return connection
+
+    if mode not in ("snapshot", "mmap"):
+        raise ValueError(f"Unknown CHINOOK_DB_MODE {mode!r}, expected 'snapshot', 'mmap', 'script' or 'pool'")
+
+    ensure_snapshot()
+
+    if mode == "mmap":
+        return snapshot.open_readonly(CHINOOK_SNAPSHOT_PATH)
+    return snapshot.load_into_memory(CHINOOK_SNAPSHOT_PATH)
+
+def ensure_snapshot():
+    """Build the snapshot if it is missing or corrupt, or upgrade it if it is out of date.
+    Only the very first boot touches the network."""
+    try:
+        meta = snapshot.verify_snapshot(CHINOOK_SNAPSHOT_PATH)
+    except snapshot.SnapshotError:
+        snapshot.build_snapshot(fetch_chinook_sql(), CHINOOK_SNAPSHOT_PATH)
+        return
+
+    if meta.get("version") != snapshot.SNAPSHOT_VERSION:
+        snapshot.upgrade_snapshot(CHINOOK_SNAPSHOT_PATH)
+
+# Create db
+def get_engine_for_chinook_db(mode: str = None):
+    """Connect to the Chinook database and create engine."""
+    return get_engines_for_chinook_db(mode)[0]
+
+def get_engines_for_chinook_db(mode: str = None):
+    """Return (read_engine, write_engine).
+
+    Single-connection modes share one engine for both, whose pool lends the one connection to one
+    thread at a time. The pool mode hands reads to CHINOOK_POOL_SIZE read-only connections and
+    serializes writes on a single read-write one."""
+    mode = mode or CHINOOK_DB_MODE
+
+    if mode == "pool":
+        ensure_snapshot()
+        live_path = snapshot.prepare_wal_copy(CHINOOK_SNAPSHOT_PATH)
+
+        read_engine = create_engine(
+            "sqlite://",
+            creator=lambda: snapshot.open_wal_reader(live_path), # a fresh read-only connection per pool slot
+            poolclass=QueuePool,
+            pool_size=CHINOOK_POOL_SIZE,
+            max_overflow=0, # callers wait for a free reader rather than opening unbounded connections
+        )
+        write_engine = create_engine(
+            "sqlite://",
+            creator=lambda: snapshot.open_wal_writer(live_path),
+            poolclass=QueuePool,
+            pool_size=1, # sqlite only ever has one writer, queue here rather than on SQLITE_BUSY
+            max_overflow=0,
+        )
+        return read_engine, write_engine
+
+    connection = connect_chinook_db(mode)
+
+    engine = create_engine(
+        "sqlite://", # tells sqlalchemy "im working with sqlite", it's empty as we're going to supply our own connection
+        creator=lambda: connection, # this tells sqlalchemy to use, and re-use our connection. this is important as the db lives in ram so the connection must stay the same
+        # a pool of exactly that one connection, checked out by one thread at a time. Threads sharing
+        # it concurrently can deadlock once the query time budget's progress handler is installed
+        poolclass=QueuePool,
+        pool_size=1,
+        max_overflow=0,
+        connect_args={"check_same_thread": False}, # same as before, allow use of connections across threads
+    )
+    return engine, engine
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_WRITE_KEYWORD = re.compile(r"\b(?:insert|update|delete|replace\b(?!\s*\())\b", re.IGNORECASE) # not the replace() function
+
+def is_read_only_sql(sql_query: str) -> bool:
+    """Cheap check for statements that can go to a reader connection."""
+    words = sql_query.lstrip(" \t\n\r(").split(None, 1)
+    if not words:
+        return False
+    if words[0].upper() == "WITH":
+        # a CTE is a read unless a write follows it, string literals can't make it one
+        return not _WRITE_KEYWORD.search(_STRING_LITERAL.sub("''", sql_query))
+    return words[0].upper() in ("SELECT", "EXPLAIN", "VALUES")
+
+def build_model():
+    """Create the chat model shared by every node."""
+    return ChatOpenAI(temperature=0, streaming=True, model=MODEL_NAME)
+
+# Lazy singletons, nothing is built until a node or tool first asks for it
+_lock = threading.RLock()
+_engines = None
+_model = None
+
+def _get_engines():
+    global _engines
+    if _engines is None:
+        with _lock:
+            if _engines is None:
+                _engines = get_engines_for_chinook_db()
+    return _engines
+
+def get_engine():
+    """Return the shared read engine, building the database on first use."""
+    return _get_engines()[0]
+
+def get_write_engine():
+    """Return the shared write engine, the same as get_engine() unless CHINOOK_DB_MODE=pool."""
+    return _get_engines()[1]
+
+# Database calls from async nodes and tools run on their own executor, sized to the connections
+# that can actually work in parallel: the reader pool plus the writer, or the one shared connection
+_db_executor = None
+
+def get_db_executor() -> ThreadPoolExecutor:
+    global _db_executor
+    if _db_executor is None:
+        with _lock:
+            if _db_executor is None:
+                workers = CHINOOK_POOL_SIZE + 1 if CHINOOK_DB_MODE == "pool" else 1
+                _db_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chinook-db")
+    return _db_executor
+
+# Batches of reads fan out over the reader pool on this executor. It is separate from the one
+# above because the batch itself is already running on a database executor thread
+_read_executor = None
+
+def get_read_executor() -> ThreadPoolExecutor:
+    global _read_executor
+    if _read_executor is None:
+        with _lock:
+            if _read_executor is None:
+                _read_executor = ThreadPoolExecutor(max_workers=CHINOOK_POOL_SIZE, thread_name_prefix="chinook-read")
+    return _read_executor
+
+async def run_db(fn, *args, **kwargs):
+    """Await a blocking database call without tying up the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_db_executor(), functools.partial(fn, *args, **kwargs))
+
+# Writes the tools make themselves, like create_invoice, queue on this single thread and commit one
+# at a time in the order they were submitted, instead of contending for the write connection
+_write_executor = None
+
+def get_write_executor() -> ThreadPoolExecutor:
+    global _write_executor
+    if _write_executor is None:
+        with _lock:
+            if _write_executor is None:
+                _write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chinook-write")
+    return _write_executor
+
+def run_write(fn, *args, **kwargs):
+    """Run a write on the writer thread and wait for it."""
+    return get_write_executor().submit(fn, *args, **kwargs).result()
+
+async def arun_write(fn, *args, **kwargs):
+    """Await a write on the writer thread without tying up the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_write_executor(), functools.partial(fn, *args, **kwargs))
+
+def get_model() -> ChatOpenAI:
+    """Return the shared chat model, creating the client on first use."""
+    global _model
+    if _model is None:
+        with _lock:
+            if _model is None:
+                _model = build_model()
+    return _model
+
+# Bumped by set_model so bound models cached in the graph modules know to rebuild
+_model_generation = [0]
+
+def set_model(model):
+    """Swap the shared model, e.g. for a local stand-in. Graph modules re-bind tools on the next call."""
+    global _model
+    with _lock:
+        _model = model
+        _model_generation[0] += 1
+
+def bind_tools_lazily(tools):
+    """Return a zero-arg function giving get_model().bind_tools(tools), bound once per model."""
+    cache = {}
+
+    def get_bound_model():
+        generation = _model_generation[0]
+        if cache.get("generation") != generation:
+            with _lock:
+                if cache.get("generation") != generation:
+                    cache["model"] = get_model().bind_tools(tools)
+                    cache["generation"] = generation
+        return cache["model"]
+
+    return get_bound_model
+
+def reset():
+    """Drop the shared engines and model so they are rebuilt on next use."""
+    global _engines, _model
+    with _lock:
+        if _engines is not None:
+            for engine in set(_engines):
+                engine.dispose()
+        _engines = None
+        _model = None
+        _model_generation[0] += 1
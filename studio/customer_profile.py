@@ -0,0 +1,72 @@
+"""A compact account summary, loaded once when the customer signs in.
+
+Without it the model's first iterations after sign-in are usually get_table_info on Invoice and
+InvoiceLine followed by history queries. The profile answers the common account questions (how
+many orders, how much spent, what did I buy last, what do I listen to) straight from the prompt.
+
+It is one statement, a UNION ALL of three sections keyed by the section column, and is stored in
+State as a plain dict so it survives checkpointing. It reflects the account at sign-in and is
+reloaded after each create_invoice. Other changes, e.g. a write through make_sql_query, are not in it,
+and the prompt says so.
+"""
+from sqlalchemy.engine import Engine
+from query import run_query
+
+RECENT_PURCHASES = 5
+TOP_GENRES = 3
+PROFILE_AGE = "(as of sign-in or the last create_invoice)"
+PROFILE_USE = ("Answer questions this summary covers from it, without tool calls, unless the account was changed "
+               "some other way since. Then query instead.\n")
+
+PROFILE_SQL = f"""
+WITH invoices AS (
+    SELECT InvoiceId, InvoiceDate, Total FROM Invoice WHERE CustomerId = ?
+), lines AS (
+    SELECT i.InvoiceDate, il.InvoiceLineId, il.UnitPrice * il.Quantity AS Spent, t.Name, t.AlbumId, t.GenreId
+    FROM invoices i
+    JOIN InvoiceLine il ON il.InvoiceId = i.InvoiceId
+    JOIN Track t ON t.TrackId = il.TrackId
+)
+SELECT 'totals' AS section, COUNT(*) AS a, ROUND(SUM(Total), 2) AS b, date(MAX(InvoiceDate)) AS c, NULL AS d FROM invoices
+UNION ALL
+SELECT * FROM (
+    SELECT 'recent', l.Name, COALESCE(ar.Name, ''), date(l.InvoiceDate), l.Spent
+    FROM lines l
+    LEFT JOIN Album al ON al.AlbumId = l.AlbumId
+    LEFT JOIN Artist ar ON ar.ArtistId = al.ArtistId
+    ORDER BY l.InvoiceDate DESC, l.InvoiceLineId DESC LIMIT {RECENT_PURCHASES}
+)
+UNION ALL
+SELECT * FROM (
+    SELECT 'genre', g.Name, COUNT(*), ROUND(SUM(l.Spent), 2), NULL
+    FROM lines l JOIN Genre g ON g.GenreId = l.GenreId
+    GROUP BY g.GenreId ORDER BY COUNT(*) DESC, g.Name LIMIT {TOP_GENRES}
+)
+"""
+
+def load_profile(engine: Engine, customer_id: int) -> dict:
+    """Invoice count, total spend, latest purchases and most bought genres of one customer."""
+    profile = {"invoices": 0, "spent": 0.0, "last_purchase": None, "recent": [], "top_genres": []}
+    for section, a, b, c, d in run_query(engine, PROFILE_SQL, (customer_id,)).rows:
+        if section == "totals":
+            profile.update(invoices=a, spent=b or 0.0, last_purchase=c)
+        elif section == "recent":
+            profile["recent"].append({"track": a, "artist": b, "date": c, "price": d})
+        else:
+            profile["top_genres"].append({"genre": a, "tracks": b, "spent": c})
+    return profile
+
+def profile_text(profile: dict) -> str:
+    """The profile as a few lines for the system prompt."""
+    if not profile["invoices"]:
+        return f"Account summary {PROFILE_AGE}: no purchases yet.\n{PROFILE_USE}"
+
+    text = (f"Account summary {PROFILE_AGE}: {profile['invoices']} invoices, {profile['spent']} spent in total, "
+            f"last purchase on {profile['last_purchase']}.\n")
+    if profile["top_genres"]:
+        genres = ", ".join(f"{g['genre']} ({g['tracks']} tracks, {g['spent']})" for g in profile["top_genres"])
+        text += f"Most bought genres: {genres}.\n"
+    if profile["recent"]:
+        recent = "; ".join(f"{r['track']} by {r['artist']} ({r['date']}, {r['price']})" for r in profile["recent"])
+        text += f"Latest purchases: {recent}.\n"
+    return text + PROFILE_USE
@@ -0,0 +1,30 @@
+"""Deterministic fast path for sign-in.
+
+When the user's latest message contains exactly one email address, customer_email_node emits the
+get_customer_info tool call itself instead of asking the model to notice the address. Zero or
+several addresses are ambiguous and still go to the model.
+"""
+import re
+import uuid
+from typing import Optional
+from langchain_core.messages import AIMessage, HumanMessage
+
+# Pragmatic rather than RFC 5322: local part, @, dotted domain with an alphabetic TLD
+EMAIL_PATTERN = re.compile(r"(?<![\w.+-])[\w.+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}(?![\w-])")
+
+def find_single_email(messages: list) -> Optional[str]:
+    """The one email address in the latest message, if that message is the user's and has exactly one."""
+    if not messages or not isinstance(messages[-1], HumanMessage):
+        return None
+    content = messages[-1].content
+    if not isinstance(content, str):
+        return None
+    emails = {match.group(0).rstrip(".") for match in EMAIL_PATTERN.finditer(content)}
+    return emails.pop() if len(emails) == 1 else None
+
+def email_tool_call(email: str) -> AIMessage:
+    """The message the model would have produced: a bare get_customer_info call."""
+    return AIMessage(
+        content="",
+        tool_calls=[{"name": "get_customer_info", "args": {"email": email}, "id": f"call_{uuid.uuid4().hex}"}],
+    )
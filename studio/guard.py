@@ -0,0 +1,226 @@
+"""Pre-execution cost guard for model-written SQL.
+
+Before a statement runs, check_query asks sqlite for its EXPLAIN QUERY PLAN and estimates how many
+rows it will visit: a full SCAN costs the table's row count, a SEARCH through an index costs one,
+and nested loops in the same select multiply. Statements estimated over SQL_MAX_SCAN_ROWS are
+rejected; two full scans joined with no usable condition is reported as a cross join. SELECTs
+without a LIMIT get LIMIT SQL_AUTO_LIMIT appended.
+
+The estimate does not follow correlated subqueries. SQL_TIME_BUDGET is the backstop for those and
+anything else it misses: query.fetch_page interrupts a statement that runs longer than that.
+Rejections and timeouts reach the model as a small JSON error, see error_text. SQL_GUARD=off turns
+the plan check and rewriting off.
+"""
+import json
+import os
+import re
+import threading
+from collections import Counter
+from typing import NamedTuple, Optional
+from sqlalchemy.engine import Engine
+from cache import normalize_sql
+from query import QueryTimeout, run_query
+
+SQL_GUARD = os.environ.get("SQL_GUARD", "on") != "off"
+SQL_MAX_SCAN_ROWS = int(os.environ.get("SQL_MAX_SCAN_ROWS", "1000000"))
+SQL_AUTO_LIMIT = int(os.environ.get("SQL_AUTO_LIMIT", "1000"))
+SQL_TIME_BUDGET = float(os.environ.get("SQL_TIME_BUDGET", "2.0")) # seconds, 0 for no budget
+
+# "<table> <alias>" or "<table> AS <alias>" after FROM, JOIN or a comma, the plan names tables by
+# their alias. Anchored on the keyword so one match never uses up the table name of the next
+_ALIAS = re.compile(r"(?:\bfrom\b|\bjoin\b|,)\s*([\w$\"\[\]`]+)\s+(?:as\s+)?([\w$]+)", re.IGNORECASE)
+_NOT_ALIASES = {
+    "as", "on", "using", "where", "join", "inner", "left", "right", "full", "outer", "cross", "natural",
+    "group", "order", "limit", "having", "window", "union", "except", "intersect", "indexed", "not", "set",
+}
+_TRAILING_LIMIT = re.compile(r"\blimit\s+[^()]*$")
+
+class QueryRejected(Exception):
+    """The plan for a statement was estimated too expensive to run."""
+
+    def __init__(self, reason: str, estimated_rows: int, message: str):
+        super().__init__(message)
+        self.reason = reason
+        self.estimated_rows = estimated_rows
+
+class CheckedQuery(NamedTuple):
+    sql: str # the statement to execute, with a LIMIT added if it needed one
+    limit_added: Optional[int]
+    estimated_rows: int
+
+class GuardStats:
+    """Counts of checked, rewritten, rejected and timed out statements."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.limits_added = 0
+        self.rejected = Counter() # reason -> count
+        self.timeouts = 0
+
+    def record_check(self, checked: CheckedQuery):
+        with self._lock:
+            self.checked += 1
+            if checked.limit_added:
+                self.limits_added += 1
+
+    def record_rejection(self, reason: str):
+        with self._lock:
+            self.checked += 1
+            self.rejected[reason] += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "checked": self.checked,
+                "limits_added": self.limits_added,
+                "rejected": sum(self.rejected.values()),
+                "rejected_by_reason": dict(self.rejected),
+                "timeouts": self.timeouts,
+            }
+
+guard_stats = GuardStats()
+
+def _aliases(sql_query: str, names) -> dict:
+    """Map lowercased names (tables, CTEs, subqueries) and their aliases in a statement to the
+    lowercased name."""
+    names = {name.lower() for name in names}
+    aliases = {name: name for name in names}
+    for table, alias in _ALIAS.findall(sql_query):
+        table = table.strip('"[]`').lower()
+        if table in names and alias.lower() not in _NOT_ALIASES:
+            aliases[alias.lower()] = table
+    return aliases
+
+def _body(sql_query: str, name: str) -> Optional[str]:
+    """The select behind a CTE or a subquery in FROM, found by its name, or None."""
+    text = sql_query.lower()
+    name = re.escape(name)
+    cte = re.search(rf"\b{name}\s*(?:\([^()]*\))?\s+as\s+(?:not\s+)?(?:materialized\s+)?\(", text)
+    if cte:
+        start, depth = cte.end(), 1
+        for i in range(start, len(text)):
+            depth += {"(": 1, ")": -1}.get(text[i], 0)
+            if depth == 0:
+                return text[start:i]
+        return None
+    subquery = re.search(rf"\)\s*(?:as\s+)?{name}\b", text)
+    if subquery:
+        end, depth = subquery.start(), 1
+        for i in range(end - 1, -1, -1):
+            depth += {")": 1, "(": -1}.get(text[i], 0)
+            if depth == 0:
+                return text[i + 1:end]
+    return None
+
+def _is_bare_aggregate(body: Optional[str]) -> bool:
+    """True for a select with an aggregate and no GROUP BY, which returns a single row."""
+    if body is None:
+        return False
+    top = body
+    while True: # empty every parenthesis, what is left is the top level
+        emptied = re.sub(r"\([^()]*\)", "()", top)
+        if emptied == top:
+            break
+        top = emptied
+    return (top.lstrip().startswith("select")
+            and re.search(r"\b(?:count|sum|avg|min|max|total|group_concat)\s*\(\)", top) is not None
+            and re.search(r"\b(?:group\s+by|union|except|intersect)\b", top) is None)
+
+def estimate_rows_scanned(plan: list, sql_query: str, row_counts: dict) -> tuple:
+    """Return (estimated rows visited, reason it is expensive) for EXPLAIN QUERY PLAN rows.
+
+    Loops are grouped by their parent, each group costs the product of its loops and the statement
+    the sum of its groups. A CTE or subquery that sqlite materializes or runs as a co-routine is
+    costed once, from its own loops, and a scan of it costs that estimate again, or one row for a
+    bare aggregate, which never counts towards a cross join. Scans of anything else that is not a
+    known table are costed as the largest table."""
+    counts = {name.lower(): count for name, count in row_counts.items()}
+    subplans = {} # name -> id of its MATERIALIZE or CO-ROUTINE row
+    for id_, _, _, detail in plan:
+        words = detail.split(None, 1)
+        if words[0] in ("MATERIALIZE", "CO-ROUTINE") and len(words) > 1:
+            subplans[words[1].strip('"').lower()] = id_
+    aliases = _aliases(sql_query, set(counts) | set(subplans))
+    unknown = max(row_counts.values(), default=1)
+    groups = {} # parent id -> (cost, full scans)
+    for _, parent, _, detail in plan:
+        words = detail.split()
+        if words[:2] == ["SCAN", "CONSTANT"] or words[0] not in ("SCAN", "SEARCH"):
+            continue
+        cost, scans = groups.get(parent, (1, 0))
+        if words[0] == "SCAN":
+            name = words[1].strip('"').lower()
+            name = aliases.get(name, name)
+            if name in subplans:
+                # the plan lists a subplan's loops before the scans of it. A single row joins
+                # to anything without being a cross join, a materialized set can still be one
+                if not _is_bare_aggregate(_body(sql_query, name)):
+                    cost *= max(groups.get(subplans[name], (1, 0))[0], 1)
+                    scans += 1
+            else:
+                cost *= max(counts.get(name, unknown), 1)
+                scans += 1
+        groups[parent] = (cost, scans)
+
+    total = sum(cost for cost, _ in groups.values())
+    reason = "cross_join" if any(scans > 1 for _, scans in groups.values()) else "full_scan"
+    return total, reason
+
+def add_limit(sql_query: str, limit: int) -> Optional[str]:
+    """sql_query with LIMIT appended if it is a SELECT that has none at the top level, else None."""
+    words = sql_query.lstrip(" \t\n\r(").split(None, 1)
+    if not words or words[0].upper() not in ("SELECT", "WITH"):
+        return None
+    if _TRAILING_LIMIT.search(normalize_sql(sql_query)):
+        return None
+    # on its own line, so a trailing -- comment cannot swallow it
+    return f"{sql_query.strip().rstrip(';').rstrip()}\nLIMIT {limit}"
+
+def check_query(engine: Engine, sql_query: str, row_counts: dict) -> CheckedQuery:
+    """Estimate a statement's cost from its plan, raising QueryRejected if it is over budget, and
+    add a LIMIT to SELECTs that lack one."""
+    if not SQL_GUARD or sql_query.lstrip().upper().startswith("EXPLAIN"):
+        return CheckedQuery(sql_query, None, 0)
+
+    try:
+        plan = run_query(engine, "EXPLAIN QUERY PLAN " + sql_query).rows
+    except Exception:
+        # let the real execution report what is wrong with the statement
+        return CheckedQuery(sql_query, None, 0)
+
+    estimated_rows, reason = estimate_rows_scanned(plan, sql_query, row_counts)
+    if estimated_rows > SQL_MAX_SCAN_ROWS:
+        guard_stats.record_rejection(reason)
+        if reason == "cross_join":
+            message = "Two or more tables are joined without a usable join condition. Join them on their keys or filter them with WHERE."
+        else:
+            message = "The query reads too many rows. Filter it with WHERE or aggregate it."
+        raise QueryRejected(reason, estimated_rows, message)
+
+    limited = add_limit(sql_query, SQL_AUTO_LIMIT)
+    checked = CheckedQuery(limited or sql_query, SQL_AUTO_LIMIT if limited else None, estimated_rows)
+    guard_stats.record_check(checked)
+    return checked
+
+def error_text(error: Exception) -> Optional[str]:
+    """JSON error for the model if error came from the guard or the time budget, else None."""
+    if isinstance(error, QueryRejected):
+        return json.dumps({
+            "error": "query_rejected",
+            "reason": error.reason,
+            "estimated_rows_scanned": error.estimated_rows,
+            "max_rows_scanned": SQL_MAX_SCAN_ROWS,
+            "message": str(error),
+        })
+    if isinstance(error, QueryTimeout):
+        return json.dumps({
+            "error": "query_timeout",
+            "time_budget_seconds": error.time_budget,
+            "message": f"{error}. Narrow it with WHERE, join conditions or aggregates.",
+        })
+    return None
@@ -1,40 +1,16 @@
-from langchain_openai import ChatOpenAI
 from langgraph.graph import MessagesState
 from langchain_core.messages import SystemMessage, HumanMessage, RemoveMessage
-from ast import literal_eval
-import sqlite3
-import requests
-from langchain_community.utilities.sql_database import SQLDatabase
-from sqlalchemy import create_engine
-from sqlalchemy.pool import StaticPool
 from langgraph.graph import StateGraph, START, END
 from langgraph.prebuilt import ToolNode
-from langchain_core.tools import tool
 from typing import Literal
 from langgraph.types import interrupt
-
-# Create db
-def get_engine_for_chinook_db():
-    """Pull sql file, populate in-memory database, and create engine."""
-    url = "https://raw.githubusercontent.com/lerocha/chinook-database/master/ChinookDatabase/DataSources/Chinook_Sqlite.sql"
-    response = requests.get(url)
-    sql_script = response.text
-
-    connection = sqlite3.connect(":memory:", check_same_thread=False)
-    connection.executescript(sql_script) # high-level wrapper around our connection, this will now be the central object which represents the db
-    
-    return create_engine(
-        "sqlite://", # tells sqlalchemy "im working with sqlite", it's empty as we're going to supply our own connection
-        creator=lambda: connection, # this tells sqlalchemy to use, and re-use our connection. this is important as the db lives in ram so the connection must stay the same
-        poolclass=StaticPool, # similarly we do not want a dynamic connection pool to be created
-        connect_args={"check_same_thread": False}, # same as before, allow use of connections across threads
-    )
-
-engine = get_engine_for_chinook_db()
-db = SQLDatabase(engine)
-
-# Define model
-model = ChatOpenAI(temperature=0, streaming=True, model="gpt-5-nano")
+from core import bind_tools_lazily, get_engine, run_db
+from checkpointer import get_checkpointer
+from customer_profile import load_profile
+from email_capture import email_tool_call, find_single_email
+from metrics import instrument_node
+from prompts import prompt_cache_stats
+from tools import get_customer_info
 
 # Info retrieval agent message
 email_msg = SystemMessage(content="You are a conversational and friendly assistant. " \
@@ -49,38 +25,46 @@ class State(MessagesState, total=False):
 
     customer_id: int
     customer_name: str
-
-# Define tools
-@tool
-def get_customer_info(email: str) -> dict:
-    """Look up customer info given their email. ALWAYS make sure you have the email before invoking this.
-    
-    Args:
-        email: str"""
-    customer_info_as_string = db.run(f"SELECT * FROM Customer WHERE Email = '{email}';", include_columns = True)
-    customer_info = literal_eval(customer_info_as_string[1:-1])
-    customer_id = customer_info["CustomerId"]
-    customer_name = customer_info["FirstName"]
-    return {"customer_id": customer_id, "customer_name": customer_name}
-
-
+    customer_profile: dict
 
 # Bind tools to model
-customer_email_model = model.bind_tools([get_customer_info])
+get_customer_email_model = bind_tools_lazily([get_customer_info])
 
 # Create Nodes
+# Every node has a sync and an async version: graph.invoke runs the first, graph.ainvoke (and the
+# LangGraph server) the second, so an in-flight conversation never holds a thread while the LLM works
 def customer_email_node(state: State):
 
-    return {"messages": [customer_email_model.invoke([email_msg] + state["messages"])]}
+    # The user just typed one email address, skip the model and look it up straight away
+    email = find_single_email(state["messages"])
+    if email is not None:
+        return {"messages": [email_tool_call(email)]}
 
-def get_info_node(state: State):
-    """Performs the get customer info tool call."""
+    response = get_customer_email_model().invoke([email_msg] + state["messages"])
+    prompt_cache_stats.record(response)
 
-    # last message contains param tool_calls, a list of dicts
-    tool_call = state["messages"][-1].tool_calls[0]
-    
-    # make tool call, draft tool message
-    observation = get_customer_info.invoke(tool_call["args"])
+    return {"messages": [response]}
+
+async def acustomer_email_node(state: State):
+
+    email = find_single_email(state["messages"])
+    if email is not None:
+        return {"messages": [email_tool_call(email)]}
+
+    response = await get_customer_email_model().ainvoke([email_msg] + state["messages"])
+    prompt_cache_stats.record(response)
+
+    return {"messages": [response]}
+
+def confirm_customer(tool_call: dict, observation: dict):
+    """Ask the user to confirm the account we found and build the state update."""
+
+    # if we weren't able to retrieve info ask the customer to check spelling
+    if "customer_name" not in observation:
+
+        tool_message = {"role": "tool", "content" : "Error signing in! Please ask the user to recheck the spelling of their email!", "tool_call_id": tool_call["id"]}
+
+        return {'messages': tool_message}
 
     # interrupt
     decision = interrupt({
@@ -101,6 +85,33 @@ def get_info_node(state: State):
 
         return {'messages': tool_message}
 
+def get_info_node(state: State):
+    """Performs the get customer info tool call."""
+
+    # last message contains param tool_calls, a list of dicts
+    tool_call = state["messages"][-1].tool_calls[0]
+    
+    # make tool call, draft tool message
+    observation = get_customer_info.invoke(tool_call["args"])
+
+    update = confirm_customer(tool_call, observation)
+
+    # Signed in, load the account summary once so the model need not query for it
+    if "customer_id" in update:
+        update["customer_profile"] = load_profile(get_engine(), update["customer_id"])
+    return update
+
+async def aget_info_node(state: State):
+    """Performs the get customer info tool call."""
+
+    tool_call = state["messages"][-1].tool_calls[0]
+    observation = await get_customer_info.ainvoke(tool_call["args"])
+
+    update = confirm_customer(tool_call, observation)
+    if "customer_id" in update:
+        update["customer_profile"] = await run_db(load_profile, get_engine(), update["customer_id"])
+    return update
+
 # Define tool conditions
 def customer_info_condition(state: State) -> Literal["get_info_node", "__end__"]:
     """Route to email tool handler, or end if no tool is called."""
@@ -118,13 +129,13 @@ def customer_info_condition(state: State) -> Literal["get_info_node", "__end__"]
 builder = StateGraph(State)
 
 # Add nodes
-builder.add_node("get_customer_email", customer_email_node)
-builder.add_node("get_info_node", get_info_node) 
+builder.add_node("get_customer_email", instrument_node("info_agent", "get_customer_email", customer_email_node, acustomer_email_node))
+builder.add_node("get_info_node", instrument_node("info_agent", "get_info_node", get_info_node, aget_info_node))
 
 # Add edges
 builder.add_edge(START, "get_customer_email")
 builder.add_conditional_edges("get_customer_email", customer_info_condition)
 builder.add_edge("get_info_node", "get_customer_email")
 
-# Compile graph, memory is handled by LangGraph
-graph = builder.compile()
+# Compile graph. Memory is handled by LangGraph unless CHECKPOINT_PATH points at a local checkpoint file
+graph = builder.compile(checkpointer=get_checkpointer())
@@ -0,0 +1,69 @@
+"""Purchases for create_invoice.
+
+quote_invoice prices the tracks, the customer confirms the quote, then write_invoice inserts the
+invoice and all of its lines in one transaction, the lines with a single executemany. Callers run
+write_invoice on core's writer thread (run_write / arun_write), so purchases commit one at a time
+and a half-written invoice is never visible to a reader.
+
+CHINOOK_DB_MODE=mmap opens the database read-only, so there are no purchases in that mode.
+"""
+from collections import Counter
+from datetime import datetime
+from typing import NamedTuple
+from sqlalchemy.engine import Engine
+from core import CHINOOK_DB_MODE
+from query import run_query
+
+INVOICE_MAX_TRACKS = 100
+PURCHASES_ENABLED = CHINOOK_DB_MODE != "mmap"
+
+class Quote(NamedTuple):
+    """What the customer is asked to confirm: one line per distinct track."""
+
+    customer_id: int
+    lines: list # (TrackId, Name, UnitPrice, Quantity)
+    total: float
+
+    def as_dict(self) -> dict:
+        return {
+            "tracks": [{"track_id": t, "name": n, "unit_price": p, "quantity": q} for t, n, p, q in self.lines],
+            "total": self.total,
+        }
+
+def quote_invoice(engine: Engine, customer_id: int, track_ids: list) -> Quote:
+    """Price a purchase. A track listed twice is bought twice. Raises ValueError for unknown tracks."""
+    if not track_ids:
+        raise ValueError("No tracks to buy")
+    if len(track_ids) > INVOICE_MAX_TRACKS:
+        raise ValueError(f"At most {INVOICE_MAX_TRACKS} tracks per invoice")
+
+    quantities = Counter(track_ids)
+    placeholders = ", ".join("?" for _ in quantities)
+    rows = run_query(engine, f"SELECT TrackId, Name, UnitPrice FROM Track WHERE TrackId IN ({placeholders})", list(quantities))
+    prices = {track_id: (name, price) for track_id, name, price in rows.rows}
+    missing = [track_id for track_id in quantities if track_id not in prices]
+    if missing:
+        raise ValueError(f"Unknown track ids {missing}")
+
+    lines = [(track_id, *prices[track_id], quantity) for track_id, quantity in quantities.items()]
+    return Quote(customer_id, lines, round(sum(price * quantity for _, _, price, quantity in lines), 2))
+
+def write_invoice(engine: Engine, quote: Quote) -> int:
+    """Insert the invoice, billed to the customer's address, and its lines. Returns the InvoiceId."""
+    with engine.begin() as connection:
+        billing = connection.exec_driver_sql(
+            "SELECT Address, City, State, Country, PostalCode FROM Customer WHERE CustomerId = ?", (quote.customer_id,)
+        ).fetchone()
+        if billing is None:
+            raise ValueError(f"Unknown customer {quote.customer_id}")
+
+        invoice_id = connection.exec_driver_sql(
+            "INSERT INTO Invoice (CustomerId, InvoiceDate, BillingAddress, BillingCity, BillingState, BillingCountry, BillingPostalCode, Total) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (quote.customer_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), *billing, quote.total),
+        ).lastrowid
+        connection.exec_driver_sql(
+            "INSERT INTO InvoiceLine (InvoiceId, TrackId, UnitPrice, Quantity) VALUES (?, ?, ?, ?)",
+            [(invoice_id, track_id, price, quantity) for track_id, _, price, quantity in quote.lines],
+        )
+    return invoice_id
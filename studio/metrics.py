@@ -0,0 +1,353 @@
+"""Built-in instrumentation for every node and tool, exported locally.
+
+Graph nodes are registered through instrument_node (or instrument_tool_node for a ToolNode) and
+tools are wrapped with instrument_tool, which records:
+
+    sql_agent_node_seconds{graph,node,status}      node wall time, status ok, interrupted or error
+    sql_agent_tool_seconds{tool,status}            tool wall time
+    sql_agent_tool_result_bytes{tool}              size of what the tool handed back to the model
+    sql_agent_llm_tokens_total{graph,node,kind}    prompt, completion and cached prompt tokens
+    sql_agent_turn_iterations{graph,node}          agent loop iterations (AI messages) it took to answer a turn
+    sql_agent_sql_rows{kind}                       rows returned per read or write statement
+
+render() returns these, plus the query cache, prompt cache and SQL guard counters, in the
+Prometheus text format. Setting METRICS_PORT serves the same text on http://127.0.0.1:<port>/metrics.
+The counters live in the process, so that is one endpoint per process: with several worker processes
+the first to bind the port serves its own counters and the others log a warning and serve none.
+Setting OTEL_SPANS_PATH also writes one OpenTelemetry span per node and tool call, as JSON lines,
+to that file; that needs the optional opentelemetry-sdk package.
+"""
+import contextlib
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+from langgraph.errors import GraphInterrupt
+from cache import query_cache
+from guard import guard_stats
+from compaction import compaction_stats
+from prompts import prompt_cache_stats
+
+logger = logging.getLogger(__name__)
+
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0")) # 0 leaves the http endpoint off
+OTEL_SPANS_PATH = os.environ.get("OTEL_SPANS_PATH", "")
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """Monotonic total per label set."""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, **labels):
+        key = tuple(labels.get(label, "") for label in self.labels)
+        with self._lock:
+            self._values[key] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            lines.extend(f"{self.name}{_labels(self.labels, key)} {value:g}" for key, value in sorted(self._values.items()))
+        return lines
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set."""
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = ()):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        self._values = {} # label values -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(label, "") for label in self.labels)
+        with self._lock:
+            entry = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucket in zip(self.buckets, counts):
+                    le = f'le="{bound:g}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {bucket}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total:g}")
+                lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+node_seconds = Histogram("sql_agent_node_seconds", "Wall time of a graph node run.", ("graph", "node", "status"), SECONDS)
+tool_seconds = Histogram("sql_agent_tool_seconds", "Wall time of a tool call.", ("tool", "status"), SECONDS)
+tool_result_bytes = Histogram(
+    "sql_agent_tool_result_bytes", "Size of a tool result handed to the model.", ("tool",),
+    (256, 1024, 4096, 16384, 65536, 262144),
+)
+llm_tokens = Counter("sql_agent_llm_tokens_total", "Tokens in model calls made by a node.", ("graph", "node", "kind"))
+turn_iterations = Histogram(
+    "sql_agent_turn_iterations", "Agent loop iterations (AI messages) it took a node to answer one user turn.", ("graph", "node"),
+    (1, 2, 3, 4, 5, 6, 8, 10, 15, 20),
+)
+sql_rows = Histogram("sql_agent_sql_rows", "Rows returned to the model per SQL statement.", ("kind",), (0, 1, 5, 10, 50, 100, 500, 1000))
+
+_metrics = [node_seconds, tool_seconds, tool_result_bytes, llm_tokens, turn_iterations, sql_rows]
+
+def _stats_lines(prefix: str, stats: dict, counters: tuple) -> list:
+    """Render one of the *_stats() dicts: keys in counters as <prefix>_<key>_total, other numbers as gauges."""
+    lines = []
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            continue
+        name = f"{prefix}_{key}_total" if key in counters else f"{prefix}_{key}"
+        lines.append(f"# TYPE {name} {'counter' if key in counters else 'gauge'}")
+        lines.append(f"{name} {float(value):g}")
+    return lines
+
+def render() -> str:
+    """Every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    lines.extend(_stats_lines(
+        "sql_agent_query_cache", query_cache.stats(),
+        ("hits", "misses", "evictions", "expirations", "invalidations"),
+    ))
+    lines.extend(_stats_lines(
+        "sql_agent_prompt_cache", prompt_cache_stats.stats(),
+        ("calls", "calls_with_usage", "prompt_tokens", "cached_prompt_tokens", "uncached_prompt_tokens"),
+    ))
+    lines.extend(_stats_lines(
+        "sql_agent_compaction", compaction_stats.stats(),
+        ("calls", "tokens_before", "tokens_after", "tokens_saved", "outputs_compacted", "schemas_dropped"),
+    ))
+    guard = guard_stats.stats()
+    lines.extend(_stats_lines("sql_agent_sql_guard", guard, ("checked", "limits_added", "rejected", "timeouts")))
+    lines.append("# TYPE sql_agent_sql_guard_rejected_by_reason_total counter")
+    lines.extend(
+        f'sql_agent_sql_guard_rejected_by_reason_total{{reason="{_escape(reason)}"}} {count}'
+        for reason, count in sorted(guard["rejected_by_reason"].items())
+    )
+    return "\n".join(lines) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # scrapes every few seconds would drown the server log
+
+def serve(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve render() on http://host:port/metrics from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+# Lazily set up the optional exporters the first time a graph is instrumented
+_lock = threading.Lock()
+_started = False
+_tracer = None
+
+def _start_exporters():
+    global _started, _tracer
+    with _lock:
+        if _started:
+            return
+        _started = True
+        if METRICS_PORT:
+            try:
+                serve(METRICS_PORT)
+            except OSError as e:
+                # another worker process already has the port, every process keeps its own counters
+                logger.warning("METRICS_PORT %s is not available (%s), this process serves no /metrics", METRICS_PORT, e)
+        if OTEL_SPANS_PATH:
+            _tracer = _file_tracer(OTEL_SPANS_PATH)
+
+def _file_tracer(path: str):
+    """An OpenTelemetry tracer exporting to a local file, or None without opentelemetry-sdk."""
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter, SimpleSpanProcessor
+    except ImportError:
+        logger.warning("OTEL_SPANS_PATH is set but opentelemetry-sdk is not installed, no spans will be written")
+        return None
+
+    out = open(path, "a", buffering=1)
+    provider = TracerProvider(resource=Resource.create({"service.name": "sql_agent"}))
+    provider.add_span_processor(SimpleSpanProcessor(
+        ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + "\n")
+    ))
+    return provider.get_tracer("sql_agent")
+
+def _span(name: str, attributes: dict):
+    if _tracer is None:
+        return contextlib.nullcontext()
+    return _tracer.start_as_current_span(name, attributes=attributes)
+
+def _set_attributes(span, attributes: dict):
+    if span is not None:
+        span.set_attributes(attributes)
+
+def _record_node(graph: str, node: str, state, update, elapsed: float, status: str, span):
+    node_seconds.observe(elapsed, graph=graph, node=node, status=status)
+    attributes = {"status": status}
+
+    messages = update.get("messages", []) if isinstance(update, dict) else []
+    if not isinstance(messages, list):
+        messages = [messages]
+    for message in messages:
+        if not isinstance(message, AIMessage):
+            continue
+        usage = message.usage_metadata or {}
+        if usage:
+            cached = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+            llm_tokens.inc(usage.get("input_tokens", 0), graph=graph, node=node, kind="prompt")
+            llm_tokens.inc(usage.get("output_tokens", 0), graph=graph, node=node, kind="completion")
+            llm_tokens.inc(cached, graph=graph, node=node, kind="cached_prompt")
+            attributes.update(prompt_tokens=usage.get("input_tokens", 0), completion_tokens=usage.get("output_tokens", 0))
+
+        # an answer without tool calls ends the turn, count the AI messages since the user's message
+        if not message.tool_calls and isinstance(state, dict):
+            history = state.get("messages", [])
+            turn = max((i for i, m in enumerate(history) if isinstance(m, HumanMessage)), default=-1)
+            iterations = 1 + sum(isinstance(m, AIMessage) for m in history[turn + 1:])
+            turn_iterations.observe(iterations, graph=graph, node=node)
+            attributes["turn_iterations"] = iterations
+
+    _set_attributes(span, attributes)
+
+def _status_of(error: BaseException) -> str:
+    return "interrupted" if isinstance(error, GraphInterrupt) else "error"
+
+def _timed_node(graph: str, node: str, fn):
+    """Wrap a node body, sync or async, so each run is timed, counted and traced."""
+
+    if fn is None:
+        return None
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def timed(state, *args, **kwargs):
+            with _span(f"node {node}", {"graph": graph, "node": node}) as span:
+                start = time.perf_counter()
+                try:
+                    update = await fn(state, *args, **kwargs)
+                except BaseException as e:
+                    _record_node(graph, node, state, None, time.perf_counter() - start, _status_of(e), span)
+                    raise
+                _record_node(graph, node, state, update, time.perf_counter() - start, "ok", span)
+                return update
+        return timed
+
+    @functools.wraps(fn)
+    def timed(state, *args, **kwargs):
+        with _span(f"node {node}", {"graph": graph, "node": node}) as span:
+            start = time.perf_counter()
+            try:
+                update = fn(state, *args, **kwargs)
+            except BaseException as e:
+                _record_node(graph, node, state, None, time.perf_counter() - start, _status_of(e), span)
+                raise
+            _record_node(graph, node, state, update, time.perf_counter() - start, "ok", span)
+            return update
+    return timed
+
+def instrument_node(graph: str, node: str, func, afunc=None) -> RunnableLambda:
+    """The RunnableLambda to register a node with, timing its sync and async bodies."""
+    _start_exporters()
+    return RunnableLambda(_timed_node(graph, node, func), afunc=_timed_node(graph, node, afunc), name=node)
+
+def instrument_tool_node(graph: str, node: str, tool_node) -> RunnableLambda:
+    """Same as instrument_node for a ToolNode. The graph's config is passed through, the ToolNode
+    needs it to inject state and run its tools."""
+
+    def run(state, config):
+        return tool_node.invoke(state, config)
+
+    async def arun(state, config):
+        return await tool_node.ainvoke(state, config)
+
+    return instrument_node(graph, node, run, arun)
+
+def _result_bytes(result) -> int:
+    if isinstance(result, str):
+        return len(result.encode())
+    return len(json.dumps(result, default=str).encode())
+
+def _timed_tool(name: str, fn):
+    """Wrap a tool body, sync or async, so each call is timed and its result measured."""
+
+    def record(start, result, span):
+        size = _result_bytes(result)
+        tool_seconds.observe(time.perf_counter() - start, tool=name, status="ok")
+        tool_result_bytes.observe(size, tool=name)
+        _set_attributes(span, {"result_bytes": size})
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def timed(*args, **kwargs):
+            with _span(f"tool {name}", {"tool": name}) as span:
+                start = time.perf_counter()
+                try:
+                    result = await fn(*args, **kwargs)
+                except BaseException as e:
+                    tool_seconds.observe(time.perf_counter() - start, tool=name, status=_status_of(e))
+                    raise
+                record(start, result, span)
+                return result
+        return timed
+
+    @functools.wraps(fn)
+    def timed(*args, **kwargs):
+        with _span(f"tool {name}", {"tool": name}) as span:
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                tool_seconds.observe(time.perf_counter() - start, tool=name, status=_status_of(e))
+                raise
+            record(start, result, span)
+            return result
+    return timed
+
+def instrument_tool(db_tool):
+    """Time a tool's sync body and measure its result. Apply below on_db_executor, whose async path
+    runs the same body, so both paths are covered. A tool that already has its own async body gets
+    that wrapped too."""
+    db_tool.func = _timed_tool(db_tool.name, db_tool.func)
+    if db_tool.coroutine is not None:
+        db_tool.coroutine = _timed_tool(db_tool.name, db_tool.coroutine)
+    return db_tool
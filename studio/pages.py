@@ -0,0 +1,47 @@
+"""Page size limits and next-page handles for make_sql_query.
+
+make_sql_query returns at most RESULT_PAGE_ROWS rows and RESULT_PAGE_BYTES of text per statement.
+When a read has more rows, the page ends with a handle that fetch_more_rows turns into the next
+page. A handle remembers the customer, the statement and the offset, and is only honoured for the
+customer who ran the query. The registry keeps the newest RESULT_PAGE_HANDLES handles.
+"""
+import itertools
+import os
+import threading
+from collections import OrderedDict
+
+RESULT_PAGE_ROWS = int(os.environ.get("RESULT_PAGE_ROWS", "50"))
+RESULT_PAGE_BYTES = int(os.environ.get("RESULT_PAGE_BYTES", "8000"))
+RESULT_COUNT_LIMIT = int(os.environ.get("RESULT_COUNT_LIMIT", "10000")) # rows counted past a page for the total
+RESULT_PAGE_HANDLES = int(os.environ.get("RESULT_PAGE_HANDLES", "1024"))
+
+def page_limits() -> dict:
+    """Keyword arguments for query.fetch_page."""
+    return {"max_rows": RESULT_PAGE_ROWS, "max_bytes": RESULT_PAGE_BYTES, "count_limit": RESULT_COUNT_LIMIT}
+
+class PageHandles:
+    """Thread-safe, bounded map of handle -> (customer_id, sql_query, offset)."""
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._handles = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def issue(self, customer_id, sql_query: str, offset: int) -> str:
+        with self._lock:
+            handle = f"p{next(self._ids)}"
+            self._handles[handle] = (customer_id, sql_query, offset)
+            while len(self._handles) > self.max_size:
+                self._handles.popitem(last=False)
+            return handle
+
+    def resolve(self, handle: str, customer_id) -> tuple:
+        """Return (sql_query, offset) for a handle issued to this customer."""
+        with self._lock:
+            entry = self._handles.get(handle.strip())
+        if entry is None or entry[0] != customer_id:
+            raise ValueError(f"Unknown or expired page handle {handle}, run the query again")
+        return entry[1], entry[2]
+
+page_handles = PageHandles(RESULT_PAGE_HANDLES)
@@ -0,0 +1,89 @@
+"""Prompt assembly for sql_model_node, laid out for provider-side prefix caching.
+
+Providers cache the longest prompt prefix they have seen before, so content is ordered from most to
+least stable: the static instructions, then the schema digest (changes only with the schema), then
+the customer context, account summary and conversation summary (change per conversation), then the
+history (grows every call).
+Every customer and every loop iteration therefore shares the same cached prefix. Tool results the
+model has already used are compacted in the history, see compaction.py.
+
+prompt_cache_stats records cached vs uncached prompt tokens from each response's usage metadata.
+"""
+import threading
+from langchain_core.messages import SystemMessage
+from compaction import compact_tool_outputs
+from customer_profile import profile_text
+from invoices import PURCHASES_ENABLED
+
+# Guidance for the tools, identical for every customer so it belongs in the cached prefix
+TOOL_GUIDANCE = """
+You only need get_table_info for a table if you want its column types or sample rows.
+To find tracks, albums, artists or genres by name use search_catalogue, not LIKE queries.
+For recommendations use recommend_tracks.
+Older tool results are shortened in the conversation. If you need one in full again, call recall_tool_output with its reference.
+When you need several tables or queries, ask for all of them in a single tool call.
+Always use the customer's ID from the customer context below when making queries.
+Do not ask the user for their ID.
+"""
+if PURCHASES_ENABLED:
+    TOOL_GUIDANCE += "To buy tracks for the customer use create_invoice, never INSERT statements.\n"
+
+def sql_prompt_prefix(instructions: SystemMessage, catalog) -> str:
+    """Static instructions plus the schema digest, the part shared by every conversation."""
+    return (
+        f"{instructions.content}\n{TOOL_GUIDANCE}\n"
+        f"The valid database tables are: {catalog.table_names}.\n"
+        f"Their columns (PK primary key, -> foreign key) are:\n{catalog.digest}\n"
+    )
+
+def sql_model_messages(instructions: SystemMessage, state: dict, catalog) -> list:
+    """System prompt, ordered most to least stable, followed by the conversation."""
+
+    # Inject state after everything that is the same for all customers
+    state_context = f"""
+The current customer's ID is {state["customer_id"]}.
+The current customer's name is {state['customer_name']}.
+"""
+    if state.get("customer_profile"):
+        state_context += profile_text(state["customer_profile"])
+    if state.get("summary"):
+        state_context += f"Summary of the conversation so far: {state['summary']}\n"
+
+    contextual_sys_msg = SystemMessage(content=sql_prompt_prefix(instructions, catalog) + state_context)
+
+    return [contextual_sys_msg] + compact_tool_outputs(state["messages"])
+
+class PromptCacheStats:
+    """Running totals of prompt tokens served from the provider's cache."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.calls_with_usage = 0
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+
+    def record(self, response):
+        """Add one model response. Responses without usage metadata only count as calls."""
+        usage = getattr(response, "usage_metadata", None) or {}
+        prompt_tokens = usage.get("input_tokens", 0)
+        cached = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+        with self._lock:
+            self.calls += 1
+            if usage:
+                self.calls_with_usage += 1
+            self.prompt_tokens += prompt_tokens
+            self.cached_prompt_tokens += cached
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "calls_with_usage": self.calls_with_usage,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_prompt_tokens": self.cached_prompt_tokens,
+                "uncached_prompt_tokens": self.prompt_tokens - self.cached_prompt_tokens,
+                "cache_hit_ratio": self.cached_prompt_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+            }
+
+prompt_cache_stats = PromptCacheStats()
@@ -0,0 +1,164 @@
+"""Structured query layer.
+
+Rows come straight from the cursor as a columnar Rows object, so tools work with real Python values
+instead of parsing the repr string SQLDatabase.run produces. to_llm_text and page_to_llm_text are the
+only places results are turned into text, right where they are handed to the model.
+
+fetch_page streams a result from the cursor and keeps only one page of it, so a careless
+SELECT * never materializes the whole table.
+"""
+import time
+from contextlib import contextmanager
+from itertools import islice
+from typing import Any, NamedTuple, Optional, Sequence
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+MAX_CELL_CHARS = 300 # same cap SQLDatabase.run applies to long strings
+PROGRESS_STEPS = 1000 # sqlite VM instructions between time budget checks
+
+class QueryTimeout(Exception):
+    """A statement ran past its time budget and was interrupted."""
+
+    def __init__(self, time_budget: float):
+        super().__init__(f"Query ran longer than {time_budget:g}s and was stopped")
+        self.time_budget = time_budget
+
+@contextmanager
+def _time_budget(connection, time_budget: Optional[float]):
+    """Abort whatever runs on connection inside the block once time_budget seconds have passed,
+    via a sqlite progress handler. Raises QueryTimeout instead of sqlite's "interrupted" error."""
+    if not time_budget:
+        yield
+        return
+    dbapi_connection = connection.connection.dbapi_connection
+    deadline = time.monotonic() + time_budget
+    expired = []
+
+    def check():
+        if time.monotonic() > deadline:
+            expired.append(True)
+            return 1
+        return 0
+
+    dbapi_connection.set_progress_handler(check, PROGRESS_STEPS)
+    try:
+        yield
+    except OperationalError as e:
+        if expired:
+            raise QueryTimeout(time_budget) from e
+        raise
+    finally:
+        dbapi_connection.set_progress_handler(None, PROGRESS_STEPS)
+
+class Rows(NamedTuple):
+    """A result set as column names plus value tuples."""
+
+    columns: list
+    rows: list
+
+    def as_dicts(self) -> list:
+        return [dict(zip(self.columns, row)) for row in self.rows]
+
+    def first(self) -> Optional[dict]:
+        """The first row as a dict, or None if there are no rows."""
+        return dict(zip(self.columns, self.rows[0])) if self.rows else None
+
+    def column(self, name: str) -> list:
+        i = self.columns.index(name)
+        return [row[i] for row in self.rows]
+
+def run_query(engine: Engine, sql: str, parameters: Sequence[Any] = ()) -> Rows:
+    """Execute one statement and return its rows. Statements without a result set return empty Rows."""
+    with engine.begin() as connection:
+        result = connection.exec_driver_sql(sql, tuple(parameters))
+        if not result.returns_rows:
+            return Rows([], [])
+        return Rows(list(result.keys()), [tuple(row) for row in result.fetchall()])
+
+class Page(NamedTuple):
+    """One page of a result set."""
+
+    rows: Rows
+    offset: int # rows before this page
+    total: int # rows in the whole result, a lower bound if not total_exact
+    total_exact: bool
+
+    @property
+    def more(self) -> bool:
+        return self.offset + len(self.rows.rows) < self.total
+
+def fetch_page(
+    engine: Engine,
+    sql: str,
+    parameters: Sequence[Any] = (),
+    offset: int = 0,
+    max_rows: int = 50,
+    max_bytes: int = 8000,
+    count_limit: int = 10000,
+    time_budget: Optional[float] = None,
+) -> Page:
+    """Execute one statement and return the page starting at row offset: at most max_rows rows, and
+    no more than max_bytes once serialized (but always at least one row).
+
+    Rows are pulled from the cursor one at a time. Rows before the page are skipped and rows after
+    it are only counted, up to count_limit, to give the total. With a time_budget, raises
+    QueryTimeout if executing and reading the statement takes longer than that many seconds."""
+    with engine.begin() as connection, _time_budget(connection, time_budget):
+        result = connection.exec_driver_sql(sql, tuple(parameters))
+        if not result.returns_rows:
+            return Page(Rows([], []), 0, 0, True)
+        columns = list(result.keys())
+        cursor = iter(result)
+        skipped = sum(1 for _ in islice(cursor, offset))
+
+        rows = []
+        size = len(_line(columns))
+        overflow = 0 # the row that did not fit, it is the first of the next page
+        for row in cursor:
+            size += len(_line(row)) + 1
+            if len(rows) >= max_rows or (rows and size > max_bytes):
+                overflow = 1
+                break
+            rows.append(tuple(row))
+
+        counted = sum(1 for _ in islice(cursor, count_limit)) if overflow else 0
+        return Page(Rows(columns, rows), skipped, skipped + len(rows) + overflow + counted, counted < count_limit)
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    text = str(value)
+    if len(text) > MAX_CELL_CHARS:
+        text = text[:MAX_CELL_CHARS] + "..."
+    # keep one row per line and one cell per separator
+    return text.replace("\\", "\\\\").replace("\n", "\\n").replace("|", "\\|")
+
+def _line(row) -> str:
+    return "|".join(_cell(value) for value in row)
+
+def to_llm_text(rows: Rows) -> str:
+    """Serialize rows compactly for the model: a header line then one line per row, cells split by '|'.
+
+    Column names appear once instead of once per row, and NULL is an empty cell."""
+    if not rows.columns:
+        return "OK, no rows returned"
+    if not rows.rows:
+        return "|".join(rows.columns) + "\n(0 rows)"
+    lines = ["|".join(rows.columns)]
+    lines.extend(_line(row) for row in rows.rows)
+    return "\n".join(lines)
+
+def page_to_llm_text(page: Page, handle: Optional[str] = None) -> str:
+    """Serialize a page like to_llm_text, with a trailing line saying which rows these are and, if
+    there is a handle, how to get the next page."""
+    text = to_llm_text(page.rows)
+    if not page.rows.rows or (page.offset == 0 and not page.more):
+        return text
+    first, last = page.offset + 1, page.offset + len(page.rows.rows)
+    total = f"{page.total}" if page.total_exact else f"more than {page.total - 1}"
+    if not page.more:
+        return f"{text}\n(rows {first}-{last} of {total}, no more rows)"
+    if handle is None:
+        return f"{text}\n(rows {first}-{last} of {total}, the rest were not returned)"
+    return f"{text}\n(rows {first}-{last} of {total}, call fetch_more_rows with handle {handle} for the next page)"
@@ -0,0 +1,207 @@
+"""Precomputed track recommendations for recommend_tracks.
+
+Built once from the purchase history and kept in memory as NumPy arrays:
+
+    purchases           customer x track, how many of each track a customer bought
+    genre_affinity      customer x genre, the share of a customer's purchases in each genre
+    artist_affinity     customer x artist, likewise per artist
+    neighbours          track x RECOMMEND_NEIGHBOURS, the most similar tracks by co-purchase (cosine
+                        over their buyers), with the similarities in neighbour_weights. The full
+                        track x track matrix is almost all zeros, so only each row's top entries are kept
+
+A recommendation scores every track the customer has not bought on co-purchase with what they did
+buy, their genre and artist affinity and overall popularity, and keeps at most MAX_PER_ARTIST tracks
+per artist so the list works as a playlist.
+
+Inserts into Invoice or InvoiceLine call mark_stale(). The next get_recommender() then folds in only
+the invoice lines added since (by InvoiceLineId), updating the rows of the customers and tracks they
+touch. Anything it cannot place, a new customer or track, triggers a full rebuild instead. Any other
+write to those tables can remove or change purchases, so it calls invalidate() and the index is
+rebuilt.
+"""
+import os
+import threading
+import numpy as np
+from sqlalchemy.engine import Engine
+from core import get_engine
+from query import Rows, run_query
+
+RECOMMEND_NEIGHBOURS = int(os.environ.get("RECOMMEND_NEIGHBOURS", "20"))
+MAX_PER_ARTIST = 2
+
+# co-purchase, genre affinity, artist affinity, popularity
+WEIGHTS = np.array([0.5, 0.25, 0.2, 0.05], dtype=np.float32)
+
+TRACKS_SQL = """
+SELECT t.TrackId, t.Name, COALESCE(ar.Name, '') AS Artist, al.ArtistId, COALESCE(g.Name, '') AS Genre, t.GenreId, t.UnitPrice
+FROM Track t
+LEFT JOIN Album al ON al.AlbumId = t.AlbumId
+LEFT JOIN Artist ar ON ar.ArtistId = al.ArtistId
+LEFT JOIN Genre g ON g.GenreId = t.GenreId
+ORDER BY t.TrackId
+"""
+LINES_SQL = """
+SELECT il.InvoiceLineId, i.CustomerId, il.TrackId, il.Quantity
+FROM InvoiceLine il JOIN Invoice i ON i.InvoiceId = il.InvoiceId
+WHERE il.InvoiceLineId > ?
+ORDER BY il.InvoiceLineId
+"""
+
+def _codes(values: list) -> tuple:
+    """Integer code per value and the distinct values in code order, None included as a value."""
+    distinct = list(dict.fromkeys(values))
+    lookup = {value: code for code, value in enumerate(distinct)}
+    return np.array([lookup[value] for value in values], dtype=np.int32), distinct
+
+def _one_hot(codes: np.ndarray, size: int) -> np.ndarray:
+    matrix = np.zeros((len(codes), size), dtype=np.float32)
+    matrix[np.arange(len(codes)), codes] = 1
+    return matrix
+
+def _scaled(values: np.ndarray) -> np.ndarray:
+    top = values.max()
+    return values / top if top > 0 else values
+
+class RecommendationIndex:
+    """Purchase matrix, affinities and co-purchase neighbours for every customer and track."""
+
+    def __init__(self, tracks: Rows, customer_ids: list):
+        self.track_ids = np.array(tracks.column("TrackId"))
+        self.track_index = {track_id: i for i, track_id in enumerate(tracks.column("TrackId"))}
+        self.customer_index = {customer_id: i for i, customer_id in enumerate(customer_ids)}
+        self.track_names = tracks.column("Name")
+        self.artist_names = tracks.column("Artist")
+        self.genre_names = tracks.column("Genre")
+        self.prices = tracks.column("UnitPrice")
+
+        self.track_genre, genres = _codes(tracks.column("GenreId"))
+        self.track_artist, artists = _codes(tracks.column("ArtistId"))
+        self._genre_one_hot = _one_hot(self.track_genre, len(genres))
+        self._artist_one_hot = _one_hot(self.track_artist, len(artists))
+
+        n_customers, n_tracks = len(customer_ids), len(self.track_ids)
+        self.purchases = np.zeros((n_customers, n_tracks), dtype=np.float32)
+        self.genre_affinity = np.zeros((n_customers, len(genres)), dtype=np.float32)
+        self.artist_affinity = np.zeros((n_customers, len(artists)), dtype=np.float32)
+        self.neighbour_count = max(0, min(RECOMMEND_NEIGHBOURS, n_tracks - 1))
+        self.neighbours = np.zeros((n_tracks, self.neighbour_count), dtype=np.int32)
+        self.neighbour_weights = np.zeros((n_tracks, self.neighbour_count), dtype=np.float32)
+        self.popularity = np.zeros(n_tracks, dtype=np.float32)
+        self.last_line_id = 0 # newest InvoiceLineId folded in
+
+    @classmethod
+    def build(cls, engine: Engine) -> "RecommendationIndex":
+        tracks = run_query(engine, TRACKS_SQL)
+        customer_ids = run_query(engine, "SELECT CustomerId FROM Customer ORDER BY CustomerId").column("CustomerId")
+        index = cls(tracks, customer_ids)
+        if not index.add_lines(run_query(engine, LINES_SQL, (0,)).rows):
+            raise ValueError("Invoice lines reference unknown customers or tracks")
+        return index
+
+    def add_lines(self, lines: list) -> bool:
+        """Fold in (InvoiceLineId, CustomerId, TrackId, Quantity) rows. Returns False, changing nothing,
+        if any refers to a customer or track the index does not know."""
+        try:
+            placed = [(self.customer_index[customer_id], self.track_index[track_id], quantity or 1)
+                      for _, customer_id, track_id, quantity in lines]
+        except KeyError:
+            return False
+        if not placed:
+            return True
+
+        rows, columns, quantities = (np.array(values) for values in zip(*placed))
+        np.add.at(self.purchases, (rows, columns), quantities.astype(np.float32))
+        np.add.at(self.popularity, columns, quantities.astype(np.float32))
+        self.last_line_id = max(self.last_line_id, max(line[0] for line in lines))
+
+        customers = np.unique(rows)
+        self._update_affinities(customers)
+
+        # co-purchase similarities change for the new tracks and everything their buyers bought
+        bought = self.purchases > 0
+        buyers = np.flatnonzero(bought[:, np.unique(columns)].any(axis=1))
+        self._update_neighbours(np.flatnonzero(bought[buyers].any(axis=0)))
+        return True
+
+    def _update_affinities(self, customers: np.ndarray):
+        purchases = self.purchases[customers]
+        totals = purchases.sum(axis=1, keepdims=True)
+        totals[totals == 0] = 1
+        self.genre_affinity[customers] = purchases @ self._genre_one_hot / totals
+        self.artist_affinity[customers] = purchases @ self._artist_one_hot / totals
+
+    def _update_neighbours(self, tracks: np.ndarray, block: int = 512):
+        if self.neighbour_count == 0 or len(tracks) == 0:
+            return
+        bought = (self.purchases > 0).astype(np.float32)
+        norms = np.sqrt(bought.sum(axis=0))
+        norms[norms == 0] = 1
+        normalized = bought / norms
+        for start in range(0, len(tracks), block):
+            rows = tracks[start:start + block]
+            similarity = normalized[:, rows].T @ normalized # len(rows) x tracks
+            similarity[np.arange(len(rows)), rows] = 0
+            top = np.argpartition(-similarity, self.neighbour_count - 1, axis=1)[:, :self.neighbour_count]
+            self.neighbours[rows] = top
+            self.neighbour_weights[rows] = np.take_along_axis(similarity, top, axis=1)
+
+    def recommend(self, customer_id: int, k: int = 10) -> Rows:
+        """Top k tracks the customer has not bought yet, with the main reason for each."""
+        if customer_id not in self.customer_index:
+            raise ValueError(f"Unknown customer {customer_id}")
+        c = self.customer_index[customer_id]
+        bought = np.flatnonzero(self.purchases[c])
+
+        co_purchase = np.zeros(len(self.track_ids), dtype=np.float32)
+        np.add.at(co_purchase, self.neighbours[bought].ravel(), self.neighbour_weights[bought].ravel())
+        components = np.stack([
+            _scaled(co_purchase),
+            _scaled(self.genre_affinity[c][self.track_genre]),
+            _scaled(self.artist_affinity[c][self.track_artist]),
+            _scaled(self.popularity),
+        ]) * WEIGHTS[:, None]
+        scores = components.sum(axis=0)
+        scores[bought] = -np.inf
+
+        rows, per_artist = [], {}
+        for i in np.argsort(-scores, kind="stable"):
+            if len(rows) >= k or scores[i] == -np.inf:
+                break
+            artist = self.track_artist[i]
+            if per_artist.get(artist, 0) >= MAX_PER_ARTIST:
+                continue
+            per_artist[artist] = per_artist.get(artist, 0) + 1
+            reason = ("bought together with your tracks", f"you like {self.genre_names[i]}",
+                      f"you like {self.artist_names[i]}", "popular")[int(components[:, i].argmax())]
+            rows.append((int(self.track_ids[i]), self.track_names[i], self.artist_names[i], self.genre_names[i], self.prices[i], reason))
+        return Rows(["TrackId", "Name", "Artist", "Genre", "UnitPrice", "Reason"], rows)
+
+# Lazy singleton, built on first use, refreshed incrementally after mark_stale()
+_lock = threading.Lock()
+_index = None
+_stale = False
+
+def get_recommender() -> RecommendationIndex:
+    """Return the shared index, building it on first use and folding in new invoice lines if stale."""
+    global _index, _stale
+    with _lock:
+        if _index is None:
+            _index = RecommendationIndex.build(get_engine())
+            _stale = False
+        elif _stale:
+            lines = run_query(get_engine(), LINES_SQL, (_index.last_line_id,)).rows
+            if not _index.add_lines(lines):
+                _index = RecommendationIndex.build(get_engine())
+            _stale = False
+        return _index
+
+def mark_stale():
+    """New invoice lines may have been written, pick them up on the next get_recommender()."""
+    global _stale
+    _stale = True
+
+def invalidate():
+    """Forget the index so the next get_recommender() rebuilds it, e.g. after DDL."""
+    global _index
+    with _lock:
+        _index = None
@@ -0,0 +1,127 @@
+"""Full-text catalogue search over track, album, artist and genre names.
+
+The index is built with the rest of the database (see snapshot.apply_indexes), so it is baked into
+the snapshot and never rebuilt per boot. It is a plain table of search items plus two FTS5 indexes
+over it:
+
+    catalogue_search_prefix    unicode61 tokens of the name and its detail (album, artist, genre),
+                               with prefix indexes so "stair zep" finds Stairway To Heaven
+    catalogue_search_trigram   trigrams of the name, for misspellings: "led zepelin" still shares
+                               most of its trigrams with Led Zeppelin
+
+search() asks the prefix index first and fills up from the trigram index. Everything is named
+catalogue_search* so the schema catalog can leave it out of what the model sees. The index is a
+snapshot of the catalogue: call build_search_index again after changing Track, Album, Artist or Genre.
+"""
+import re
+import sqlite3
+from sqlalchemy.engine import Engine
+from query import Rows, run_query
+
+SEARCH_TABLE_PREFIX = "catalogue_search"
+KINDS = ("track", "album", "artist", "genre")
+
+_SCHEMA = """
+DROP TABLE IF EXISTS catalogue_search_prefix;
+DROP TABLE IF EXISTS catalogue_search_trigram;
+DROP TABLE IF EXISTS catalogue_search_items;
+CREATE TABLE catalogue_search_items (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    item_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    detail TEXT NOT NULL
+);
+
+INSERT INTO catalogue_search_items (kind, item_id, name, detail)
+SELECT 'artist', ar.ArtistId, ar.Name, COUNT(al.AlbumId) || ' albums'
+FROM Artist ar LEFT JOIN Album al ON al.ArtistId = ar.ArtistId
+WHERE ar.Name IS NOT NULL GROUP BY ar.ArtistId;
+
+INSERT INTO catalogue_search_items (kind, item_id, name, detail)
+SELECT 'album', al.AlbumId, al.Title, COALESCE(ar.Name, '')
+FROM Album al LEFT JOIN Artist ar ON ar.ArtistId = al.ArtistId;
+
+INSERT INTO catalogue_search_items (kind, item_id, name, detail)
+SELECT 'genre', g.GenreId, g.Name, COUNT(t.TrackId) || ' tracks'
+FROM Genre g LEFT JOIN Track t ON t.GenreId = g.GenreId
+WHERE g.Name IS NOT NULL GROUP BY g.GenreId;
+
+INSERT INTO catalogue_search_items (kind, item_id, name, detail)
+SELECT 'track', t.TrackId, t.Name,
+       COALESCE(al.Title, '') || ' - ' || COALESCE(ar.Name, '') || ' - ' || COALESCE(g.Name, '') || ' - ' || t.UnitPrice
+FROM Track t
+LEFT JOIN Album al ON al.AlbumId = t.AlbumId
+LEFT JOIN Artist ar ON ar.ArtistId = al.ArtistId
+LEFT JOIN Genre g ON g.GenreId = t.GenreId;
+
+CREATE VIRTUAL TABLE catalogue_search_prefix USING fts5(
+    name, detail, content='catalogue_search_items', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE VIRTUAL TABLE catalogue_search_trigram USING fts5(
+    name, content='catalogue_search_items', content_rowid='id', tokenize='trigram'
+);
+INSERT INTO catalogue_search_prefix (catalogue_search_prefix) VALUES ('rebuild');
+INSERT INTO catalogue_search_trigram (catalogue_search_trigram) VALUES ('rebuild');
+"""
+
+# A match in the name counts ten times as much as one in the detail
+_PREFIX_SEARCH = """
+SELECT i.kind, i.item_id AS id, i.name, i.detail
+FROM catalogue_search_prefix f JOIN catalogue_search_items i ON i.id = f.rowid
+WHERE catalogue_search_prefix MATCH ? {kinds}
+ORDER BY bm25(catalogue_search_prefix, 10.0, 1.0) LIMIT ?
+"""
+_TRIGRAM_SEARCH = """
+SELECT i.kind, i.item_id AS id, i.name, i.detail
+FROM catalogue_search_trigram f JOIN catalogue_search_items i ON i.id = f.rowid
+WHERE catalogue_search_trigram MATCH ? {kinds}
+ORDER BY bm25(catalogue_search_trigram) LIMIT ?
+"""
+
+def build_search_index(connection: sqlite3.Connection):
+    """(Re)build the search items and both FTS5 indexes on a writable connection."""
+    connection.executescript(_SCHEMA)
+    connection.commit()
+
+def ensure_search_index(connection: sqlite3.Connection):
+    """Build the search index if the database does not have one yet."""
+    exists = connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'catalogue_search_trigram'"
+    ).fetchone()
+    if exists is None:
+        build_search_index(connection)
+
+def _quote(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+def prefix_query(text: str) -> str:
+    """FTS5 query matching every word of text as a prefix, or "" if text has no words."""
+    return " ".join(_quote(word) + "*" for word in re.findall(r"\w+", text.lower()))
+
+def trigram_query(text: str) -> str:
+    """FTS5 query matching any trigram of the words in text, or "" if none is long enough."""
+    trigrams = []
+    for word in re.findall(r"\w+", text.lower()):
+        trigrams.extend(word[i:i + 3] for i in range(len(word) - 2))
+    return " OR ".join(_quote(trigram) for trigram in dict.fromkeys(trigrams))
+
+def search(engine: Engine, text: str, kinds=None, limit: int = 10) -> Rows:
+    """Best matches for text as kind|id|name|detail rows, prefix matches first."""
+    kinds = [kind for kind in (kinds or KINDS) if kind in KINDS]
+    if not kinds:
+        raise ValueError(f"kinds must be some of {list(KINDS)}")
+    kind_filter = "AND i.kind IN (" + ", ".join("?" for _ in kinds) + ")"
+
+    columns, rows, seen = ["kind", "id", "name", "detail"], [], set()
+    for sql, match in ((_PREFIX_SEARCH, prefix_query(text)), (_TRIGRAM_SEARCH, trigram_query(text))):
+        if len(rows) >= limit or not match:
+            continue
+        result = run_query(engine, sql.format(kinds=kind_filter), (match, *kinds, limit))
+        columns = result.columns
+        for row in result.rows:
+            if (row[0], row[1]) not in seen and len(rows) < limit:
+                seen.add((row[0], row[1]))
+                rows.append(row)
+    return Rows(columns, rows)
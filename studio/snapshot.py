@@ -0,0 +1,197 @@
+"""Build-once, checksummed SQLite snapshot of the Chinook database.
+
+The first boot turns Chinook_Sqlite.sql into a database file plus a small json sidecar holding
+its sha256. Later boots verify the checksum and either open the file read-only and memory-mapped,
+or copy it into memory with the SQLite backup API. Neither needs the network or re-parses the script.
+
+Prebuild a snapshot (e.g. in a Docker image for air-gapped pods) from the studio directory with:
+
+    python snapshot.py --sql path/to/Chinook_Sqlite.sql
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import search
+
+DEFAULT_SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "chinook.sqlite")
+MMAP_SIZE = 256 * 1024 * 1024
+
+# Bump when the snapshot layout changes, older snapshots are upgraded in place by upgrade_snapshot
+SNAPSHOT_VERSION = 3
+
+# Indexes the agents rely on, on top of what the Chinook script creates
+INDEXES = [
+    # sign-in looks customers up by email, case-insensitively
+    "CREATE INDEX IF NOT EXISTS IX_Customer_Email_NoCase ON Customer (Email COLLATE NOCASE)",
+]
+
+class SnapshotError(Exception):
+    """Raised when a snapshot is missing or its checksum does not match."""
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _checksum_path(path: str) -> str:
+    return path + ".json"
+
+def apply_indexes(connection: sqlite3.Connection):
+    """Create any missing INDEXES and the catalogue search index on a writable connection."""
+    for sql in INDEXES:
+        connection.execute(sql)
+    connection.commit()
+    search.ensure_search_index(connection)
+
+def _write_meta(path: str, meta: dict):
+    tmp_meta = _checksum_path(path) + ".tmp"
+    with open(tmp_meta, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_meta, _checksum_path(path))
+
+def _write_atomically(source: sqlite3.Connection, path: str) -> str:
+    """Copy source into a temporary file next to path, rename it into place and return its sha256.
+
+    Concurrent workers never see a half-written snapshot."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(fd)
+    try:
+        target = sqlite3.connect(tmp_path)
+        source.backup(target)
+        target.close()
+        sha256 = _sha256_file(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return sha256
+
+def build_snapshot(sql_script: str, path: str = DEFAULT_SNAPSHOT_PATH) -> dict:
+    """Execute the sql script into a new database file at path and write its checksum sidecar."""
+    # Parse the script in memory and copy the result out in one go, rather than syncing every INSERT to disk
+    source = sqlite3.connect(":memory:")
+    source.executescript(sql_script)
+    apply_indexes(source)
+    source.execute("VACUUM") # compact pages so readers map as little as possible
+
+    meta = {
+        "version": SNAPSHOT_VERSION,
+        "sha256": _write_atomically(source, path),
+        "source_sha256": hashlib.sha256(sql_script.encode("utf-8")).hexdigest(),
+    }
+    source.close()
+    _write_meta(path, meta)
+
+    return meta
+
+def upgrade_snapshot(path: str = DEFAULT_SNAPSHOT_PATH) -> dict:
+    """Bring a snapshot from an older SNAPSHOT_VERSION up to date without the sql script."""
+    meta = verify_snapshot(path)
+    source = load_into_memory(path)
+    apply_indexes(source)
+    source.execute("VACUUM")
+
+    meta = dict(meta, version=SNAPSHOT_VERSION, sha256=_write_atomically(source, path))
+    source.close()
+    _write_meta(path, meta)
+
+    return meta
+
+def verify_snapshot(path: str = DEFAULT_SNAPSHOT_PATH) -> dict:
+    """Check the snapshot file against its sidecar checksum, returning the metadata or raising SnapshotError."""
+    if not os.path.exists(path) or not os.path.exists(_checksum_path(path)):
+        raise SnapshotError(f"No snapshot at {path}")
+
+    with open(_checksum_path(path)) as f:
+        meta = json.load(f)
+
+    actual = _sha256_file(path)
+    if actual != meta.get("sha256"):
+        raise SnapshotError(f"Checksum mismatch for {path}: expected {meta.get('sha256')}, got {actual}")
+
+    return meta
+
+def open_readonly(path: str = DEFAULT_SNAPSHOT_PATH) -> sqlite3.Connection:
+    """Open the snapshot read-only and memory-mapped, so worker processes share the OS page cache."""
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    connection.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    return connection
+
+def load_into_memory(path: str = DEFAULT_SNAPSHOT_PATH) -> sqlite3.Connection:
+    """Copy the snapshot into a private, writable in-memory database with the backup API."""
+    source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    connection = sqlite3.connect(":memory:", check_same_thread=False)
+    try:
+        source.backup(connection)
+    finally:
+        source.close()
+    return connection
+
+def prepare_wal_copy(path: str = DEFAULT_SNAPSHOT_PATH, live_path: str = None) -> str:
+    """Create a writable WAL-mode working copy of the snapshot if one does not exist yet, returning its path.
+
+    Writes made through the pool land in this copy and persist across restarts, delete it to start fresh."""
+    live_path = live_path or os.path.splitext(path)[0] + ".live.sqlite"
+    if os.path.exists(live_path):
+        connection = open_wal_writer(live_path)
+        apply_indexes(connection) # copies made by an older version may be missing some
+        connection.close()
+        return live_path
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(live_path) or ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        target = sqlite3.connect(tmp_path)
+        source.backup(target)
+        source.close()
+        apply_indexes(target)
+        target.execute("PRAGMA journal_mode=WAL") # persistent, readers never block the writer and vice versa
+        target.close()
+        os.replace(tmp_path, live_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return live_path
+
+def open_wal_reader(live_path: str) -> sqlite3.Connection:
+    """Open one read-only connection to the WAL working copy."""
+    connection = sqlite3.connect(f"file:{live_path}?mode=ro", uri=True, check_same_thread=False)
+    connection.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    return connection
+
+def open_wal_writer(live_path: str) -> sqlite3.Connection:
+    """Open the single read-write connection to the WAL working copy."""
+    connection = sqlite3.connect(live_path, check_same_thread=False, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL") # WAL stays consistent, we only risk the last commits on power loss
+    return connection
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sql", help="local Chinook_Sqlite.sql, defaults to downloading CHINOOK_SQL_URL")
+    parser.add_argument("--out", default=os.environ.get("CHINOOK_SNAPSHOT_PATH", DEFAULT_SNAPSHOT_PATH))
+    args = parser.parse_args()
+
+    if args.sql:
+        with open(args.sql, encoding="utf-8") as f:
+            sql_script = f.read()
+    else:
+        from core import fetch_chinook_sql
+        sql_script = fetch_chinook_sql()
+
+    meta = build_snapshot(sql_script, args.out)
+    print(f"Wrote {args.out} (sha256 {meta['sha256']})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Token-budgeted conversation summarization, kept off the critical path.
+
+sql_model_node keeps a running token estimate of the history in State["history_tokens"], adding only
+the messages that arrived since its last call. Nothing is summarized until that passes
+SUMMARY_TOKEN_BUDGET, and SUMMARY_MODE decides who waits for it:
+
+    inline      summarize at the end of the turn, before the graph reaches END (the old behaviour)
+    deferred    end the turn straight away and summarize at the start of the next one
+    background  end the turn straight away, summarize on a worker thread and fold the result in at
+                the start of the next turn (falls back to inline without a thread_id to key it on)
+"""
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langgraph.config import get_config
+from prompts import prompt_cache_stats
+
+SUMMARY_TOKEN_BUDGET = int(os.environ.get("SUMMARY_TOKEN_BUDGET", "4000"))
+SUMMARY_MODE = os.environ.get("SUMMARY_MODE", "background")
+
+def summary_prompt(summary: str, messages: list) -> list:
+    """The conversation followed by an instruction to create or extend the summary."""
+
+    # Create our summarization prompt
+    if summary:
+
+        # If a summary already exists, add it to the prompt
+        summary_message = (
+            f"This is summary of the conversation to date: {summary}\n\n"
+            "Extend the summary by taking into account the new messages above:"
+        )
+
+    else:
+        # If no summary exists, just create a new one
+        summary_message = "Create a summary of the conversation above:"
+
+    # Add prompt to our history
+    return messages + [HumanMessage(content=summary_message)]
+
+def count_history_tokens(state: dict, response) -> int:
+    """Running token estimate after sql_model_node adds response.
+
+    Only the messages since the previous model response are counted, the rest is already in the total."""
+    messages = state["messages"]
+    if "history_tokens" not in state:
+        new_messages = messages
+    else:
+        last_ai = max((i for i, m in enumerate(messages) if isinstance(m, AIMessage)), default=-1)
+        new_messages = messages[last_ai + 1:]
+    return state.get("history_tokens", 0) + count_tokens_approximately(new_messages + [response])
+
+def over_budget(state: dict) -> bool:
+    return state.get("history_tokens", 0) > SUMMARY_TOKEN_BUDGET
+
+def is_turn_start(state: dict) -> bool:
+    """The summarizer runs at the start of a turn when the newest message is the user's."""
+    messages = state["messages"]
+    return bool(messages) and isinstance(messages[-1], HumanMessage)
+
+def should_summarize_after_answer(state: dict) -> bool:
+    """Whether to route to the summarizer once the model has answered without tool calls."""
+    return over_budget(state) and SUMMARY_MODE in ("inline", "background")
+
+def should_summarize_before_turn(state: dict) -> bool:
+    """Whether to route to the summarizer before the model sees a new user message."""
+    return over_budget(state) and SUMMARY_MODE != "inline"
+
+def messages_to_fold(state: dict, keep_last: bool) -> list:
+    """Messages the summary replaces. At the start of a turn that is everything before the new user
+    message, otherwise everything, or everything but the final answer if keep_last."""
+    messages = state["messages"]
+    if is_turn_start(state) or keep_last:
+        return messages[:-1]
+    return messages
+
+def summary_update(state: dict, summary: str, folded: list) -> dict:
+    """Store the summary, remove the folded messages and reset the token count to what is left."""
+    folded_ids = {m.id for m in folded}
+    remaining = [m for m in state["messages"] if m.id not in folded_ids]
+    return {
+        "summary": summary,
+        "messages": [RemoveMessage(id=m.id) for m in state["messages"] if m.id in folded_ids],
+        "history_tokens": count_tokens_approximately(remaining),
+    }
+
+def current_thread_id() -> Optional[str]:
+    try:
+        return get_config().get("configurable", {}).get("thread_id")
+    except RuntimeError:
+        return None
+
+class BackgroundSummaries:
+    """Summaries computed on a worker thread after the turn ended, waiting to be folded in."""
+
+    def __init__(self, max_pending: int = 10000):
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="summarizer")
+        self._pending = OrderedDict() # thread_id -> (future, folded messages)
+        self._lock = threading.Lock()
+        self.max_pending = max_pending
+
+    def submit(self, thread_id: str, model, summary: str, folded: list, prompt_messages: list):
+        def summarize():
+            response = model.invoke(summary_prompt(summary, prompt_messages))
+            prompt_cache_stats.record(response)
+            return response.content
+
+        future = self._executor.submit(summarize)
+        with self._lock:
+            self._pending[thread_id] = (future, folded)
+            self._pending.move_to_end(thread_id)
+            while len(self._pending) > self.max_pending:
+                self._pending.popitem(last=False) # that thread will just summarize on its next turn
+
+    def pop(self, thread_id: Optional[str]):
+        """Return (future, folded) for the thread, or None if nothing usable is pending."""
+        if thread_id is None:
+            return None
+        with self._lock:
+            pending = self._pending.pop(thread_id, None)
+        if pending is None or (pending[0].done() and pending[0].exception() is not None):
+            return None
+        return pending
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+background_summaries = BackgroundSummaries()
+
+def run_summarizer(state: dict, model, keep_last: bool) -> dict:
+    """Body of summarizer_node: schedule, fold in or compute the summary depending on where in the turn we are."""
+    thread_id = current_thread_id()
+    summary = state.get("summary", "")
+
+    # End of turn in background mode, hand the work to a thread and let the graph reach END
+    if not is_turn_start(state) and SUMMARY_MODE == "background" and thread_id is not None:
+        folded = messages_to_fold(state, keep_last)
+        background_summaries.submit(thread_id, model, summary, folded, state["messages"])
+        return {}
+
+    pending = background_summaries.pop(thread_id) if is_turn_start(state) else None
+    if pending is not None:
+        future, folded = pending
+        return summary_update(state, future.result(), folded)
+
+    folded = messages_to_fold(state, keep_last)
+    prompt_messages = state["messages"][:-1] if is_turn_start(state) else state["messages"]
+    response = model.invoke(summary_prompt(summary, prompt_messages))
+    prompt_cache_stats.record(response)
+    return summary_update(state, response.content, folded)
+
+async def arun_summarizer(state: dict, model, keep_last: bool) -> dict:
+    """Async body of summarizer_node, see run_summarizer."""
+    thread_id = current_thread_id()
+    summary = state.get("summary", "")
+
+    if not is_turn_start(state) and SUMMARY_MODE == "background" and thread_id is not None:
+        folded = messages_to_fold(state, keep_last)
+        background_summaries.submit(thread_id, model, summary, folded, state["messages"])
+        return {}
+
+    pending = background_summaries.pop(thread_id) if is_turn_start(state) else None
+    if pending is not None:
+        future, folded = pending
+        return summary_update(state, await asyncio.wrap_future(future), folded)
+
+    folded = messages_to_fold(state, keep_last)
+    prompt_messages = state["messages"][:-1] if is_turn_start(state) else state["messages"]
+    response = await model.ainvoke(summary_prompt(summary, prompt_messages))
+    prompt_cache_stats.record(response)
+    return summary_update(state, response.content, folded)
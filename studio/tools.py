@@ -0,0 +1,353 @@
+from typing import Annotated, Optional
+from langchain_core.messages import ToolMessage
+from langchain_core.tools import InjectedToolCallId, tool
+from langgraph.prebuilt import InjectedState
+from langgraph.types import Command, interrupt
+from core import CHINOOK_DB_MODE, arun_write, get_engine, get_write_engine, get_read_executor, is_read_only_sql, run_db, run_write
+from catalog import get_catalog, invalidate, is_schema_change
+from cache import query_cache, tables_in
+from customer_profile import load_profile
+from metrics import instrument_tool, sql_rows
+from guard import SQL_TIME_BUDGET, CheckedQuery, check_query, error_text, guard_stats
+from pages import page_handles, page_limits
+from invoices import PURCHASES_ENABLED, Quote, quote_invoice, write_invoice
+from query import Page, QueryTimeout, fetch_page, page_to_llm_text, run_query, to_llm_text
+import recommend
+import search
+
+# Tools shared by all three graphs
+
+def on_db_executor(db_tool):
+    """Give a sync tool an async path that runs its body on the database executor, so
+    ToolNode.ainvoke never blocks the event loop on sqlite."""
+    async def coroutine(*args, **kwargs):
+        return await run_db(db_tool.func, *args, **kwargs)
+
+    db_tool.coroutine = coroutine
+    return db_tool
+
+def with_coroutine(coroutine):
+    """Give a tool a hand-written async path, for a body that cannot move wholly onto the database
+    executor, e.g. one that also waits on the writer thread."""
+    def attach(async_tool):
+        async_tool.coroutine = coroutine
+        return async_tool
+    return attach
+
+# Sign-in lookup. Parameterized so sqlite re-uses the prepared statement, case-insensitive so it
+# is served by the IX_Customer_Email_NoCase index, and only fetches the two columns sign-in needs
+CUSTOMER_LOGIN_SQL = "SELECT CustomerId, FirstName FROM Customer WHERE Email = ? COLLATE NOCASE LIMIT 1;"
+
+def find_customer_by_email(email: str):
+    """Return (customer_id, first_name) for an email, or None if there is no such customer."""
+    rows = run_query(get_engine(), CUSTOMER_LOGIN_SQL, (email.strip(),)).rows
+    return rows[0] if rows else None
+
+@on_db_executor
+@instrument_tool
+@tool
+def get_customer_info(email: str) -> dict:
+    """Look up customer info given their email. ALWAYS make sure you have the email before invoking this.
+
+    Args:
+        email: str"""
+
+    try:
+        customer = find_customer_by_email(email)
+        if customer is None:
+            return {"error": f"No customer found with email {email}"}
+
+        customer_id, customer_name = customer
+        return {"customer_id": customer_id, "customer_name": customer_name}
+    except Exception as e:
+
+        return {"error": str(e)}
+
+def page_text(page: Page, customer_id, sql_query: str, checked: CheckedQuery) -> str:
+    """Serialize a page of a read, with a handle for the next page if there is one."""
+    sql_rows.observe(len(page.rows.rows), kind="read")
+    handle = page_handles.issue(customer_id, sql_query, page.offset + len(page.rows.rows)) if page.more else None
+    text = page_to_llm_text(page, handle)
+    if checked.limit_added and page.total >= checked.limit_added:
+        text += f"\n(stopped at LIMIT {checked.limit_added}, added because the query had no LIMIT)"
+    return text
+
+def sql_error_text(e: Exception) -> str:
+    """What the model sees when a statement fails, structured for guard rejections and timeouts."""
+    if isinstance(e, QueryTimeout):
+        guard_stats.record_timeout()
+    return error_text(e) or f"Error: {e}"
+
+def run_sql(sql_query: str, customer_id) -> str:
+    """Run one statement through the cost guard and the result cache and return its first page
+    serialized for the model."""
+    catalog = get_catalog()
+
+    # Reads are served from the cache, scoped to the signed in customer. Only the first page is
+    # kept, that is all the model sees until it asks for more
+    if is_read_only_sql(sql_query):
+        cached = query_cache.get(customer_id, sql_query)
+        if cached is None:
+            generation = query_cache.generation
+            checked = check_query(get_engine(), sql_query, catalog.row_counts)
+            page = fetch_page(get_engine(), checked.sql, time_budget=SQL_TIME_BUDGET, **page_limits())
+            cached = (page, checked)
+            query_cache.put(customer_id, sql_query, tables_in(sql_query, catalog.table_names), cached, generation)
+        page, checked = cached
+        return page_text(page, customer_id, sql_query, checked)
+
+    # Writes drop cached results for every table they mention, DDL drops everything. A write is
+    # never re-run for a next page, so rows past the first page of a RETURNING are dropped
+    checked = check_query(get_write_engine(), sql_query, catalog.row_counts)
+    page = fetch_page(get_write_engine(), checked.sql, time_budget=SQL_TIME_BUDGET, **page_limits())
+    sql_rows.observe(len(page.rows.rows), kind="write")
+    if is_schema_change(sql_query):
+        invalidate()
+        recommend.invalidate()
+        query_cache.invalidate()
+    else:
+        written = tables_in(sql_query, catalog.table_names)
+        query_cache.invalidate(written)
+        if written & {"Invoice", "InvoiceLine"}:
+            # the index only ever adds purchases, anything but a plain INSERT may have removed
+            # or changed some, so rebuild it
+            if sql_query.upper().split(None, 2)[:2] == ["INSERT", "INTO"]:
+                recommend.mark_stale()
+            else:
+                recommend.invalidate()
+    return page_to_llm_text(page)
+
+def run_sql_batch(sql_queries: list, customer_id) -> list:
+    """Run a batch of statements, one result or error per statement.
+
+    Batches of reads run in parallel on the reader pool when there is one, anything with a
+    write runs in order so later statements see earlier ones."""
+
+    def run_one(sql_query):
+        try:
+            return run_sql(sql_query, customer_id)
+        except Exception as e:
+            return sql_error_text(e)
+
+    if len(sql_queries) > 1 and CHINOOK_DB_MODE == "pool" and all(is_read_only_sql(q) for q in sql_queries):
+        return list(get_read_executor().map(run_one, sql_queries))
+    return [run_one(sql_query) for sql_query in sql_queries]
+
+@on_db_executor
+@instrument_tool
+@tool
+def make_sql_query(sql_queries: list[str], state: Annotated[dict, InjectedState]) -> str:
+    """Query the SQL database to retrieve information relevant to you or the customer.
+    Pass every query you need right now in one call, they run as a batch in the order given.
+    Before querying a table make sure you know its columns, from the schema in your instructions or from get_table_info.
+    Some tables will contain a key for customer id.
+    The customer id is defined in the state.
+    You may not make a sql query for information that contains any other customer id.
+    Results come back as a header line of column names followed by one line per row, separated by '|'.
+    With several queries each result is preceded by a '-- [n] <query>' line.
+    Long results come back one page at a time, ending with a line that gives a handle for fetch_more_rows.
+    Prefer narrowing the query (WHERE, aggregates, LIMIT) over paging through many rows.
+    Queries that would read too many rows or run too long are refused with a JSON error saying why.
+
+    Args:
+        sql_queries: list of sql statements"""
+    outputs = run_sql_batch(sql_queries, state.get("customer_id"))
+    if len(outputs) == 1:
+        return outputs[0]
+    return "\n\n".join(f"-- [{i}] {sql_query}\n{output}" for i, (sql_query, output) in enumerate(zip(sql_queries, outputs), 1))
+
+@on_db_executor
+@instrument_tool
+@tool
+def fetch_more_rows(handle: str, state: Annotated[dict, InjectedState]) -> str:
+    """Get the next page of a make_sql_query result. Only call this if you need rows beyond the page you were given.
+
+    Args:
+        handle: the handle from the last line of the previous page"""
+    customer_id = state.get("customer_id")
+    try:
+        sql_query, offset = page_handles.resolve(handle, customer_id)
+        checked = check_query(get_engine(), sql_query, get_catalog().row_counts)
+        page = fetch_page(get_engine(), checked.sql, offset=offset, time_budget=SQL_TIME_BUDGET, **page_limits())
+    except Exception as e:
+        return sql_error_text(e)
+    return page_text(page, customer_id, sql_query, checked)
+
+@on_db_executor
+@instrument_tool
+@tool
+def get_table_info(table_names: list[str]) -> dict:
+    """Get the CREATE statement and sample rows for tables, if their columns in the schema you were given are not enough.
+    Ask for every table you need in one call. Each name HAS to be in the list db_table_names to be a valid table.
+
+    Args:
+        table_names: list of table names"""
+    catalog = get_catalog()
+    table_info = {}
+    for table_name in table_names:
+        try:
+            table_info[table_name] = catalog.table_info(table_name)
+        except Exception as e:
+            table_info[table_name] = f"Error: {e}"
+
+    return {"table_info": table_info}
+
+@on_db_executor
+@instrument_tool
+@tool
+def search_catalogue(query: str, kinds: Optional[list[str]] = None, limit: int = 10) -> str:
+    """Search the store's catalogue by name for tracks, albums, artists and genres, best matches first.
+    Matches the start of words and tolerates misspellings, so use this rather than LIKE queries to find something by name.
+    Results come back as kind|id|name|detail lines. The id is the TrackId, AlbumId, ArtistId or GenreId, use it in make_sql_query for more.
+
+    Args:
+        query: words to look for, e.g. "stairway heaven" or "led zepelin"
+        kinds: optional, only return these kinds: "track", "album", "artist", "genre"
+        limit: how many results to return, default 10"""
+    try:
+        rows = search.search(get_engine(), query, kinds, max(1, min(limit, 50)))
+    except Exception as e:
+        return f"Error: {e}"
+    return to_llm_text(rows)
+
+@on_db_executor
+@instrument_tool
+@tool
+def recommend_tracks(customer_id: int, state: Annotated[dict, InjectedState], k: int = 10) -> str:
+    """Recommend tracks the customer has not bought yet, based on what they and customers like them bought.
+    Use this for "what should I listen to next" or to build a playlist, rather than writing the query yourself.
+    Results come back as TrackId|Name|Artist|Genre|UnitPrice|Reason lines, best first.
+
+    Args:
+        customer_id: the current customer's ID
+        k: how many tracks to recommend, default 10"""
+    if customer_id != state.get("customer_id"):
+        return "Error: you can only recommend tracks for the current customer"
+    try:
+        rows = recommend.get_recommender().recommend(customer_id, max(1, min(k, 50)))
+    except Exception as e:
+        return f"Error: {e}"
+    return to_llm_text(rows)
+
+# Purchases. The graph asks the customer to confirm in its own node (confirm_purchase_node in the
+# graph modules) before the tool node runs, so resuming the interrupt re-runs only that read-only
+# step and never a tool that already wrote something. create_invoice then places the confirmed
+# order on the single writer thread, so concurrent purchases commit one after the other.
+# Without PURCHASES_ENABLED (mmap mode, read-only) the tool is not offered at all
+NOT_CONFIRMED = "The customer did not confirm the order, nothing was bought."
+NOT_ASKED = "Error: the customer was not asked to confirm this order, nothing was bought. Call create_invoice once per message."
+
+def purchase_calls(message) -> list:
+    """The create_invoice calls of an AI message."""
+    return [tool_call for tool_call in getattr(message, "tool_calls", None) or [] if tool_call["name"] == "create_invoice"]
+
+def quote_pending_purchase(engine, state: dict):
+    """(tool_call, quote) for the first create_invoice call of the last message, or None if there is
+    nothing to confirm. An order create_invoice would refuse anyway is not put to the customer."""
+    calls = purchase_calls(state["messages"][-1])
+    if not calls or not PURCHASES_ENABLED:
+        return None
+    try:
+        # the same validation the tool applies, so "1" is the customer 1 create_invoice will see
+        args = create_invoice.tool_call_schema.model_validate(calls[0]["args"])
+        if args.customer_id != state.get("customer_id"):
+            return None
+        return calls[0], quote_invoice(engine, args.customer_id, args.track_ids)
+    except Exception:
+        return None
+
+def confirm_purchase(tool_call: dict, quote: Quote) -> dict:
+    """Ask the customer to confirm the order and build the state update create_invoice reads."""
+    decision = interrupt({
+        "question": "Shall I place this order?",
+        "order": quote.as_dict()
+    })
+    return {"purchase_decision": {"tool_call_id": tool_call["id"], "confirmed": decision == "yes"}}
+
+def unconfirmed_text(state: dict, tool_call_id: str):
+    """Why an order must not be placed, or None if the customer confirmed this call."""
+    decision = state.get("purchase_decision") or {}
+    if decision.get("tool_call_id") != tool_call_id:
+        return NOT_ASKED
+    return None if decision["confirmed"] else NOT_CONFIRMED
+
+def purchase_result(quote: Quote, invoice_id: int, profile: dict, tool_call_id: str) -> Command:
+    """Drop what the purchase made stale, describe it for the model and refresh the account summary."""
+    query_cache.invalidate(("Invoice", "InvoiceLine"))
+    recommend.mark_stale()
+    sql_rows.observe(len(quote.lines), kind="write")
+    tracks = sum(quantity for *_, quantity in quote.lines)
+    text = f"Created invoice {invoice_id} for {tracks} tracks, total {quote.total}."
+    return Command(update={
+        "messages": [ToolMessage(content=text, tool_call_id=tool_call_id)],
+        "customer_profile": profile,
+    })
+
+async def acreate_invoice(customer_id: int, track_ids: list[int], state: Annotated[dict, InjectedState],
+                          tool_call_id: Annotated[str, InjectedToolCallId]):
+    if customer_id != state.get("customer_id"):
+        return "Error: you can only buy tracks for the current customer"
+    try:
+        quote = await run_db(quote_invoice, get_engine(), customer_id, track_ids)
+    except Exception as e:
+        return f"Error: {e}"
+
+    refused = unconfirmed_text(state, tool_call_id)
+    if refused:
+        return refused
+
+    try:
+        invoice_id = await arun_write(write_invoice, get_write_engine(), quote)
+    except Exception as e:
+        return f"Error: {e}"
+    profile = await run_db(load_profile, get_engine(), customer_id)
+    return purchase_result(quote, invoice_id, profile, tool_call_id)
+
+@instrument_tool
+@with_coroutine(acreate_invoice)
+@tool
+def create_invoice(customer_id: int, track_ids: list[int], state: Annotated[dict, InjectedState],
+                   tool_call_id: Annotated[str, InjectedToolCallId]):
+    """Buy tracks for the customer: creates one invoice with a line per track, after the customer confirms.
+    ALWAYS use this to make a purchase, never INSERT statements. Find the TrackIds first, e.g. with search_catalogue.
+    Call it at most once per message, with every track of the order.
+
+    Args:
+        customer_id: the current customer's ID
+        track_ids: TrackIds to buy, list a track twice to buy two copies"""
+    if customer_id != state.get("customer_id"):
+        return "Error: you can only buy tracks for the current customer"
+    try:
+        quote = quote_invoice(get_engine(), customer_id, track_ids)
+    except Exception as e:
+        return f"Error: {e}"
+
+    refused = unconfirmed_text(state, tool_call_id)
+    if refused:
+        return refused
+
+    try:
+        invoice_id = run_write(write_invoice, get_write_engine(), quote)
+    except Exception as e:
+        return f"Error: {e}"
+    return purchase_result(quote, invoice_id, load_profile(get_engine(), customer_id), tool_call_id)
+
+@instrument_tool
+@tool
+def recall_tool_output(ref: str, state: Annotated[dict, InjectedState]) -> str:
+    """Get the full text of an earlier tool result that was shortened in the conversation.
+    Only call this if the shortened version does not have what you need.
+
+    Args:
+        ref: the reference given in the shortened result"""
+    # The prompt is compacted, State still has every result in full
+    for message in reversed(state["messages"]):
+        if isinstance(message, ToolMessage) and message.tool_call_id == ref.strip():
+            return message.content if isinstance(message.content, str) else str(message.content)
+    return f"Error: no earlier tool result with reference {ref}"
+
+# Collect all tools
+sql_tools = [make_sql_query, fetch_more_rows, get_table_info, search_catalogue, recommend_tracks, recall_tool_output]
+if PURCHASES_ENABLED:
+    sql_tools.append(create_invoice)
+sql_tools_by_name = {tool.name: tool for tool in sql_tools}